@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import torch
+from ppo_pytorch.common.probability_distributions import CategoricalPd, BernoulliPd, NoiseBuffer
+
+from timing import time_call
+
+
+def bench(name, pd_cls, actors, actions, iters):
+    noise = NoiseBuffer()
+    for num_actors in actors:
+        for num_actions in actions:
+            pd = pd_cls(num_actions)
+            probs = torch.randn(num_actors, pd.prob_vector_len)
+            with torch.no_grad():
+                sample_us, buffered_us, logp_us, buffered_logp_us = [
+                    time_call(fn, iters) for fn in (
+                        lambda: pd.sample(probs),
+                        lambda: pd.sample(probs, noise),
+                        lambda: pd.sample_with_logp(probs),
+                        lambda: pd.sample_with_logp(probs, noise))]
+            print(f'{name:<11} actors {num_actors:>3} actions {num_actions:>2}: '
+                  f'sample {sample_us:6.1f} us, buffered {buffered_us:6.1f} us ({sample_us / buffered_us:.2f}x) | '
+                  f'with logp {logp_us:6.1f} us, buffered {buffered_logp_us:6.1f} us '
+                  f'({logp_us / buffered_logp_us:.2f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Action sampling with and without pregenerated NoiseBuffer')
+    parser.add_argument('--iters', type=int, default=3000, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    actors = (1, 16, 64, 256)
+    bench('categorical', CategoricalPd, actors, (4, 18), args.iters)
+    bench('bernoulli', BernoulliPd, actors, (4, 18), args.iters)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import gym.spaces
+import numpy as np
+import torch
+from ppo_pytorch.models import FCActor, CNNActor
+from ppo_pytorch.models.heads import PolicyHead, StateValueHead
+
+from timing import time_call
+
+
+def head_factory(hidden_size, pd):
+    return dict(probs=PolicyHead(hidden_size, pd), state_value=StateValueHead(hidden_size))
+
+
+def bench_actor(name, model, obs_shape, rows, iters):
+    model.eval()
+    for batch in rows:
+        input = torch.randn(batch, *obs_shape)
+        results = []
+        for fast in (False, True):
+            model.use_fast_path = fast
+            with torch.no_grad():
+                results.append(time_call(lambda: model(input), iters))
+        print(f'{name:<12} rows {batch:>3}: default {results[0]:8.1f} us, fast {results[1]:8.1f} us, '
+              f'speedup {results[0] / results[1]:.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-call latency of FCActor / CNNActor forward pass on CPU')
+    parser.add_argument('--iters', type=int, default=1000, help='timed calls per measurement')
+    parser.add_argument('--threads', type=int, default=1, help='torch CPU threads')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rows = (1, 8, 64)
+    action_space = gym.spaces.Discrete(6)
+
+    fc_obs = gym.spaces.Box(-1, 1, (8,), dtype=np.float32)
+    for hc_type in ('input', 'first', 'last'):
+        bench_actor(f'fc {hc_type}', FCActor(fc_obs, action_space, head_factory, hidden_code_type=hc_type),
+                    fc_obs.shape, rows, args.iters)
+
+    cnn_obs = gym.spaces.Box(0, 1, (4, 84, 84), dtype=np.float32)
+    bench_actor('cnn normal', CNNActor(cnn_obs, action_space, head_factory), cnn_obs.shape, rows, args.iters // 10)
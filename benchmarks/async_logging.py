@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import argparse
+import tempfile
+import time
+
+import gym.spaces
+import torch
+from ppo_pytorch.common.tensorboard_env_logger import TensorboardEnvLogger
+from ppo_pytorch.models import CNNActor
+from ppo_pytorch.models.heads import ActorCriticHead
+
+
+def head_factory(hidden_size, pd):
+    return dict(actor_critic=ActorCriticHead(hidden_size, pd))
+
+
+def log_update(logger, model, batch, step):
+    # histograms logged by `PPO._log_training_data` and `PPO._get_ppo_loss` on log steps
+    for name in ('rewards', 'returns', 'advantages', 'loss value', 'loss ent', 'ratio'):
+        logger.add_histogram(name, batch, step)
+    for name, param in model.named_parameters():
+        logger.add_histogram(name, param, step)
+    for name in ('entropy', 'loss value', 'ratio mean'):
+        logger.add_scalar(name, batch.mean(), step)
+
+
+def bench(name, queue_size, model, batch, updates):
+    with tempfile.TemporaryDirectory() as folder:
+        logger = TensorboardEnvLogger('PPO', 'bench', folder, 1, async_queue_size=queue_size)
+        blocking_ms = []
+        for step in range(updates):
+            start_time = time.time()
+            log_update(logger, model, batch, step)
+            blocking_ms.append((time.time() - start_time) * 1000)
+        start_time = time.time()
+        logger.close()
+        close_ms = (time.time() - start_time) * 1000
+        print(f'{name:<14} training thread blocked {sum(blocking_ms) / updates:7.1f} ms per update, '
+              f'background write {logger.write_time * 1000 / updates:7.1f} ms per update, '
+              f'final flush {close_ms:7.1f} ms, dropped {logger.dropped} calls')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Training thread time spent in TensorBoard logging, sync vs async')
+    parser.add_argument('--updates', type=int, default=5, help='number of logged updates')
+    parser.add_argument('--cnn-kind', type=str, default='large')
+    args = parser.parse_args()
+
+    model = CNNActor(gym.spaces.Box(0, 1, (4, 84, 84)), gym.spaces.Discrete(6), head_factory, cnn_kind=args.cnn_kind)
+    batch = torch.randn(16 * 1024)
+    bench('sync', None, model, batch, args.updates)
+    bench('async', 1024, model, batch, args.updates)
+    bench('async small', 16, model, batch, args.updates)
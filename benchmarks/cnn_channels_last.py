@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import argparse
+from functools import partial
+
+import gym.spaces
+import numpy as np
+import torch
+from ppo_pytorch.models import CNNActor, Sega_CNNActor
+from ppo_pytorch.models.heads import PolicyHead, StateValueHead
+
+from timing import time_call
+
+
+def head_factory(hidden_size, pd):
+    return dict(probs=PolicyHead(hidden_size, pd), state_value=StateValueHead(hidden_size))
+
+
+def bench_kind(name, model_factory, obs_shape, batch_size, iters):
+    obs_space = gym.spaces.Box(0, 1, obs_shape, dtype=np.float32)
+    action_space = gym.spaces.Discrete(6)
+    nchw = model_factory(obs_space, action_space, head_factory).eval()
+    nhwc = model_factory(obs_space, action_space, head_factory, channels_last=True).eval()
+    nhwc.load_state_dict(nchw.state_dict())
+
+    input = torch.rand(batch_size, *obs_shape)
+    with torch.no_grad():
+        out_nchw, out_nhwc = nchw(input), nhwc(input)
+        max_diff = max((out_nchw.probs - out_nhwc.probs).abs().max().item(),
+                       (out_nchw.state_value - out_nhwc.state_value).abs().max().item())
+        fps = [batch_size / time_call(lambda: m(input), iters, 3) * 1e6 for m in (nchw, nhwc)]
+    print(f'{name:<8} NCHW {fps[0]:8.0f} frames/s, channels_last {fps[1]:8.0f} frames/s, '
+          f'speedup {fps[1] / fps[0]:.2f}x, max abs diff {max_diff:.2e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CNNActor inference throughput in NCHW and channels last formats')
+    parser.add_argument('--batch-size', type=int, default=64, help='frames per forward pass')
+    parser.add_argument('--iters', type=int, default=20, help='timed calls per measurement')
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU threads')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    print('mkldnn', 'enabled' if torch.backends.mkldnn.is_available() else 'not available')
+    for kind in ('normal', 'large', 'grouped'):
+        bench_kind(kind, partial(CNNActor, cnn_kind=kind), (4, 84, 84), args.batch_size, args.iters)
+    bench_kind('sega', Sega_CNNActor, (1, 112, 160), args.batch_size, args.iters)
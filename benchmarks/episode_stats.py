@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import tempfile
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+from ppo_pytorch.common.episode_stats import EpisodeRecorder, EpisodeStats
+
+Reward = namedtuple('Reward', 'reward, len, episode, frame')
+
+
+def text_window(rewards, lengths, log_every, window, folder):
+    # previous `TensorboardEnvLogger.step` path
+    reward_window = deque(maxlen=window)
+    new_rewards = []
+    with open(os.path.join(folder, 'episodes'), 'a') as episodes_file:
+        for episode, (reward, length) in enumerate(zip(rewards, lengths)):
+            reward_window.append(reward)
+            new_rewards.append(Reward(reward, length, episode, episode * 10))
+            episodes_file.write(f'{reward}, {length}\n')
+            if len(new_rewards) == log_every:
+                np.mean(reward_window), np.std(reward_window)
+                np.mean([r.episode for r in new_rewards]), np.mean([r.frame for r in new_rewards])
+                np.mean([r.len for r in new_rewards]), np.mean([r.reward for r in new_rewards])
+                new_rewards.clear()
+                episodes_file.flush()
+
+
+def streaming(rewards, lengths, log_every, window, folder):
+    stats = EpisodeStats(16, window)
+    recorder = EpisodeRecorder(os.path.join(folder, 'episodes'))
+    for episode, (reward, length) in enumerate(zip(rewards, lengths)):
+        stats.add(episode % 16, reward, length, episode * 10)
+        recorder.append(reward, length, episode % 16, episode * 10)
+        if stats.new_episodes == log_every:
+            stats.window_summary()
+            stats.interval_summary()
+            recorder.flush()
+    recorder.close()
+
+
+def bench(fn, rewards, lengths, log_every, window):
+    with tempfile.TemporaryDirectory() as folder:
+        start_time = time.perf_counter()
+        fn(rewards, lengths, log_every, window, folder)
+        episode_us = (time.perf_counter() - start_time) * 1e6 / len(rewards)
+        size = sum(os.path.getsize(os.path.join(dir, f)) for dir, _, files in os.walk(folder) for f in files)
+    return episode_us, size / len(rewards)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Episode statistics: deque and text file vs streaming and binary columns')
+    parser.add_argument('--episodes', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    rewards = (rng.randn(args.episodes) * 100).tolist()
+    lengths = rng.randint(10, 10000, args.episodes).tolist()
+    for log_every, window in ((100, 100), (1000, 100), (1000, 10000)):
+        old_us, old_size = bench(text_window, rewards, lengths, log_every, window)
+        new_us, new_size = bench(streaming, rewards, lengths, log_every, window)
+        print(f'log every {log_every:>3} episodes, window {window:>5}: text {old_us:5.2f} us {old_size:4.1f} B, '
+              f'streaming {new_us:5.2f} us {new_size:4.1f} B per episode ({old_us / new_us:.2f}x)')
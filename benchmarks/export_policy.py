@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import gym.spaces
+import numpy as np
+import torch
+from ppo_pytorch.models import FCActor, CNNActor, export_policy
+from ppo_pytorch.models.heads import ActorCriticHead
+
+from timing import time_call
+
+RUNTIME_PATH = Path(__file__).resolve().parent.parent / 'policy_runtime.py'
+
+# model is created from `ppo_pytorch` and loaded from state dict
+FULL_PACKAGE_START = '''
+import gym.spaces, numpy as np, torch
+from ppo_pytorch.models import {actor}
+from ppo_pytorch.models.heads import ActorCriticHead
+model = {actor}(gym.spaces.Box(0, 1, {obs_shape}), gym.spaces.Discrete(6),
+                lambda hidden_size, pd: dict(actor_critic=ActorCriticHead(hidden_size, pd))).eval()
+model.load_state_dict(torch.load('{state_dict_path}'))
+with torch.no_grad():
+    model.pd.sample(model(torch.zeros(1, *{obs_shape})).probs)
+'''
+
+# only policy_runtime.py is imported, as if copied to deployment
+RUNTIME_START = '''
+import importlib.util, numpy as np
+spec = importlib.util.spec_from_file_location('policy_runtime', '{runtime_path}')
+policy_runtime = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(policy_runtime)
+policy = policy_runtime.load_policy('{policy_path}')
+policy(np.zeros((1, *{obs_shape}), dtype=np.float32))
+'''
+
+
+def head_factory(hidden_size, pd):
+    return dict(actor_critic=ActorCriticHead(hidden_size, pd))
+
+
+def load_runtime():
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('policy_runtime', str(RUNTIME_PATH))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cold_start_ms(code, runs):
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times) * 1000
+
+
+def eager_step(model, states, image_observation):
+    # same conversion as `PPO._step`
+    if image_observation:
+        states = torch.tensor(states * 255, dtype=torch.uint8)
+    else:
+        states = torch.tensor(states, dtype=torch.float)
+    with torch.no_grad():
+        return model.pd.sample(model(states).probs).numpy()
+
+
+def bench(name, model, image_observation, rows, iters, cold_start_runs, folder):
+    model.eval()
+    obs_shape = model.observation_space.shape
+    state_dict_path, policy_path = folder / f'{name}.pth', folder / f'{name}.pt'
+    torch.save(model.state_dict(), state_dict_path)
+    export_policy(model, policy_path, image_observation=image_observation)
+    policy = load_runtime().load_policy(policy_path)
+
+    for batch in rows:
+        states = np.random.rand(batch, *obs_shape).astype(np.float32)
+        probs, state_value = policy.evaluate(states)
+        eager_input = torch.tensor(states * 255, dtype=torch.uint8) if image_observation else torch.from_numpy(states)
+        with torch.no_grad():
+            eager_out = model(eager_input)
+        max_diff = max((probs - eager_out.probs).abs().max().item(),
+                       (state_value - eager_out.state_value).abs().max().item())
+        eager_us = time_call(lambda: eager_step(model, states, image_observation), iters)
+        runtime_us = time_call(lambda: policy(states), iters)
+        print(f'{name:<4} batch {batch:>3}: eager {eager_us:8.1f} us, exported {runtime_us:8.1f} us '
+              f'({eager_us / runtime_us:.2f}x), max abs diff {max_diff:.1e}')
+
+    if cold_start_runs != 0:
+        actor = type(model).__name__
+        full = cold_start_ms(FULL_PACKAGE_START.format(
+            actor=actor, obs_shape=obs_shape, state_dict_path=state_dict_path), cold_start_runs)
+        runtime = cold_start_ms(RUNTIME_START.format(
+            runtime_path=RUNTIME_PATH, policy_path=policy_path, obs_shape=obs_shape), cold_start_runs)
+        print(f'{name:<4} cold start: full package {full:7.0f} ms, policy_runtime {runtime:7.0f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exported TorchScript policy vs full ppo_pytorch package')
+    parser.add_argument('--iters', type=int, default=1000, help='timed calls per measurement')
+    parser.add_argument('--cold-start-runs', type=int, default=5,
+                        help='interpreter launches per cold start measurement, 0 to skip')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        folder = Path(folder)
+        bench('fc', FCActor(gym.spaces.Box(0, 1, (32,)), gym.spaces.Discrete(6), head_factory),
+              False, (1, 16, 256), args.iters, args.cold_start_runs, folder)
+        bench('cnn', CNNActor(gym.spaces.Box(0, 1, (4, 84, 84)), gym.spaces.Discrete(6), head_factory),
+              True, (1, 16), args.iters // 10, args.cold_start_runs, folder)
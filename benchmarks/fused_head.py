@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import gym.spaces
+import torch
+from ppo_pytorch.models import FCActor
+from ppo_pytorch.models.heads import ActorCriticHead, PolicyHead, StateValueHead
+
+from timing import time_call
+
+
+def separate_heads(hidden_size, pd):
+    return dict(probs=PolicyHead(hidden_size, pd), state_value=StateValueHead(hidden_size))
+
+
+def fused_head(hidden_size, pd):
+    return dict(actor_critic=ActorCriticHead(hidden_size, pd))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FCActor latency: separate policy / value heads vs ActorCriticHead')
+    parser.add_argument('--iters', type=int, default=5000, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    obs_space = gym.spaces.Box(-1, 1, (32,))
+    for action_space in (gym.spaces.Discrete(4), gym.spaces.Discrete(18), gym.spaces.Box(-1, 1, (6,))):
+        separate = FCActor(obs_space, action_space, separate_heads).eval()
+        fused = FCActor(obs_space, action_space, fused_head)
+        # separate heads checkpoint is converted on load
+        fused.load_state_dict(separate.state_dict())
+        fused.eval()
+        for batch in (1, 16, 256):
+            input = torch.randn(batch, *obs_space.shape)
+            with torch.no_grad():
+                out_separate, out_fused = separate(input), fused(input)
+                max_diff = max((out_separate.probs - out_fused.probs).abs().max().item(),
+                               (out_separate.state_value - out_fused.state_value).abs().max().item())
+                separate_us, fused_us = [time_call(lambda: model(input), args.iters) for model in (separate, fused)]
+            print(f'{str(action_space):<14} batch {batch:>3}: separate {separate_us:6.1f} us, '
+                  f'fused {fused_us:6.1f} us ({separate_us / fused_us:.2f}x), max abs diff {max_diff:.1e}')
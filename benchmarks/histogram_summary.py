@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import gym.spaces
+import torch
+from ppo_pytorch.common.tensorboard_env_logger import TensorboardEnvLogger
+from ppo_pytorch.models import CNNActor
+from ppo_pytorch.models.heads import ActorCriticHead
+
+
+def head_factory(hidden_size, pd):
+    return dict(actor_critic=ActorCriticHead(hidden_size, pd))
+
+
+def log_histograms(logger, model, batch, step):
+    # histograms logged by `PPO._log_training_data` and `PPO._get_ppo_loss` on log steps
+    for name in ('rewards', 'returns', 'advantages', 'loss value', 'loss ent', 'ratio'):
+        logger.add_histogram(name, batch, step)
+    for name, param in model.named_parameters():
+        logger.add_histogram(name, param, step)
+
+
+def bench(name, model, batch, updates, **logger_kwargs):
+    with tempfile.TemporaryDirectory() as folder:
+        # synchronous, so all histogram work is measured
+        logger = TensorboardEnvLogger('PPO', 'bench', folder, 1, async_queue_size=None, **logger_kwargs)
+        start_time = time.time()
+        for step in range(updates):
+            log_histograms(logger, model, batch, step)
+        update_ms = (time.time() - start_time) * 1000 / updates
+        logger.close()
+        size = sum(f.stat().st_size for f in Path(folder).glob('**/events*'))
+        print(f'{name:<28} {update_ms:8.1f} ms per update, {size / updates / 1024:7.1f} KB per update')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TensorBoard histograms: full tensors vs pre-binned summaries')
+    parser.add_argument('--updates', type=int, default=5, help='number of logged updates')
+    parser.add_argument('--cnn-kind', type=str, default='large')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    model = CNNActor(gym.spaces.Box(0, 1, (4, 84, 84)), gym.spaces.Discrete(6), head_factory,
+                     cnn_kind=args.cnn_kind).to(args.device)
+    batch = torch.randn(16 * 1024, device=args.device)
+    bench('full tensors', model, batch, args.updates, histogram_bins=None)
+    bench('64 bins', model, batch, args.updates, histogram_bins=64, histogram_max_elements=None)
+    bench('64 bins, subsample 65536', model, batch, args.updates, histogram_bins=64, histogram_max_elements=1 << 16)
+    bench('16 bins, subsample 4096', model, batch, args.updates, histogram_bins=16, histogram_max_elements=1 << 12)
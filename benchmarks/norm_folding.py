@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import argparse
+import copy
+
+import gym.spaces
+import torch
+import torch.nn as nn
+from ppo_pytorch.models import FCActor, CNNActor, BatchNormFactory
+from ppo_pytorch.models.heads import ActorCriticHead
+from ppo_pytorch.models.utils import fold_batch_norm
+
+from timing import time_call
+
+
+def head_factory(hidden_size, pd):
+    return dict(actor_critic=ActorCriticHead(hidden_size, pd))
+
+
+def randomize_norm_stats(model):
+    """Make folding non-trivial, fresh norms have identity running stats"""
+    for m in model.modules():
+        if isinstance(m, nn.modules.batchnorm._BatchNorm):
+            m.running_mean.normal_(0, 0.5)
+            m.running_var.uniform_(0.5, 2)
+            m.weight.data.normal_(1, 0.2)
+            m.bias.data.normal_(0, 0.2)
+
+
+def bench(name, model, obs_shape, rows, iters):
+    randomize_norm_stats(model)
+    model.eval()
+    folded = fold_batch_norm(copy.deepcopy(model))
+    folded.refresh_fast_path()
+    for batch in rows:
+        input = torch.randn(batch, *obs_shape)
+        with torch.no_grad():
+            out, out_folded = model(input), folded(input)
+            max_diff = max((out.probs - out_folded.probs).abs().max().item(),
+                           (out.state_value - out_folded.state_value).abs().max().item())
+            norm_us, folded_us = [time_call(lambda: m(input), iters) for m in (model, folded)]
+        print(f'{name:<12} batch {batch:>3}: with norm {norm_us:8.1f} us, folded {folded_us:8.1f} us '
+              f'({norm_us / folded_us:.2f}x), max abs diff {max_diff:.1e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Actor latency with BatchNorm vs BatchNorm folded into weights')
+    parser.add_argument('--iters', type=int, default=2000, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    action_space = gym.spaces.Discrete(6)
+    fc_obs = gym.spaces.Box(-1, 1, (32,))
+    cnn_obs = gym.spaces.Box(0, 1, (4, 84, 84))
+    for hc_type in ('input', 'first', 'last'):
+        bench(f'fc {hc_type}', FCActor(fc_obs, action_space, head_factory, hidden_code_type=hc_type,
+                                       norm=BatchNormFactory(allow_after_first_layer=True)),
+              fc_obs.shape, (1, 16, 256), args.iters)
+    bench('cnn normal', CNNActor(cnn_obs, action_space, head_factory, norm=BatchNormFactory()),
+          cnn_obs.shape, (1, 16, 64), args.iters // 10)
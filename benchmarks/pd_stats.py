@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import torch
+from ppo_pytorch.common.probability_distributions import CategoricalPd, BernoulliPd, DiagGaussianPd, \
+    MultivecGaussianPd
+
+from timing import time_call
+
+
+def separate_stats(pd, actions, probs, probs_old):
+    return pd.logp(actions, probs), pd.logp(actions, probs_old), pd.entropy(probs), pd.kl(probs_old, probs)
+
+
+def loss_step(stats_fn, pd, actions, probs, probs_old):
+    # forward and backward, as in `PPO._get_ppo_loss`
+    logp, logp_old, entropy, kl = stats_fn(pd, actions, probs, probs_old)
+    loss = (logp - logp_old.detach()).mean() + entropy.mean() + kl.mean()
+    loss.backward()
+    probs.grad = None
+
+
+def bench(name, pd, rows, iters):
+    for batch in rows:
+        probs = torch.randn(batch, pd.prob_vector_len, requires_grad=True)
+        probs_old = probs.detach() + 0.1 * torch.randn_like(probs)
+        actions = pd.sample(probs_old).squeeze(-1) if isinstance(pd, CategoricalPd) else pd.sample(probs_old)
+        actions = actions.float() if isinstance(pd, BernoulliPd) else actions
+
+        separate, fused = separate_stats(pd, actions, probs, probs_old), pd.stats(actions, probs, probs_old)
+        max_diff = max((a - b).abs().max().item() for a, b in zip(separate, fused))
+        separate_us = time_call(lambda: loss_step(separate_stats, pd, actions, probs, probs_old), iters)
+        stats_us = time_call(lambda: loss_step(type(pd).stats, pd, actions, probs, probs_old), iters)
+        print(f'{name:<12} batch {batch:>5}: separate {separate_us:8.1f} us, stats {stats_us:8.1f} us '
+              f'({separate_us / stats_us:.2f}x), max abs diff {max_diff:.1e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PPO loss statistics: separate logp/entropy/kl calls vs pd.stats')
+    parser.add_argument('--iters', type=int, default=500, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    rows = (256, 4096)
+    bench('categorical', CategoricalPd(18), rows, args.iters)
+    bench('bernoulli', BernoulliPd(8), rows, args.iters)
+    bench('diag gauss', DiagGaussianPd(6), rows, args.iters)
+    bench('multivec', MultivecGaussianPd(6, 16), rows, args.iters)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+import gym.spaces
+import numpy as np
+import torch
+from ppo_pytorch.common.phase_timer import PhaseTimer
+from ppo_pytorch.ppo.ppo import PPO
+
+from timing import time_call
+
+
+def nested_spans(timer):
+    with timer.span('eval'):
+        with timer.span('take step'):
+            pass
+
+
+def train_time(phase_timing, num_actors, steps, seed=0):
+    torch.manual_seed(seed)
+    rng = np.random.RandomState(seed)
+    obs_space, act_space = gym.spaces.Box(-1, 1, (16,), dtype=np.float32), gym.spaces.Discrete(6)
+    alg = PPO(obs_space, act_space, num_actors=num_actors, horizon=64, batch_size=256, ppo_iters=4,
+              phase_timing=phase_timing)
+    states = rng.uniform(-1, 1, (steps + 1, num_actors, 16)).astype(np.float32)
+    rewards = rng.randn(steps, num_actors)
+    dones = rng.rand(steps, num_actors) < 0.01
+    start_time = time.perf_counter()
+    for i in range(steps):
+        alg.eval(states[i])
+        alg.reward(rewards[i])
+        alg.finish_episodes(dones[i])
+    alg.timer.report()
+    return time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Overhead of PPO phase timers')
+    parser.add_argument('--iters', type=int, default=100000, help='timed calls per span measurement')
+    parser.add_argument('--steps', type=int, default=1280, help='PPO steps per training measurement')
+    parser.add_argument('--repeats', type=int, default=5, help='best of N training measurements')
+    args = parser.parse_args()
+
+    for enabled in (False, True):
+        timer = PhaseTimer(enabled)
+        span_us = time_call(lambda: nested_spans(timer), args.iters)
+        print(f'timing {"on " if enabled else "off"}: two nested spans {span_us:5.2f} us')
+
+    for num_actors in (1, 16):
+        # interleaved, so both modes see same machine load
+        times = [[train_time(enabled, num_actors, args.steps) for enabled in (False, True)]
+                 for _ in range(args.repeats)]
+        off, on = np.min(times, 0)
+        print(f'actors {num_actors:>2}: {args.steps} steps timing off {off:6.2f} s, on {on:6.2f} s '
+              f'(overhead {(on / off - 1) * 100:+.2f}%)')
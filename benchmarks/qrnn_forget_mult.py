@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import torch
+from ppo_pytorch.common.qrnn import cpu_forget_mult
+from torchqrnn.forget_mult import ForgetMult
+
+from timing import time_call
+
+
+def loop_forget_mult(f, x, hidden):
+    return ForgetMult()(f, x, hidden, use_cuda=False)
+
+
+def forward_backward(fn, f, x, hidden):
+    fn(f, x, hidden).sum().backward()
+
+
+def bench(batch_size, hidden_size, seq_len, iters):
+    f = torch.rand(seq_len, batch_size, hidden_size, requires_grad=True)
+    x = torch.randn(seq_len, batch_size, hidden_size, requires_grad=True)
+    hidden = torch.randn(batch_size, hidden_size, requires_grad=True)
+
+    out_loop, out_new = loop_forget_mult(f, x, hidden), cpu_forget_mult(f, x, hidden)
+    grad = torch.randn_like(out_loop)
+    grads_loop = torch.autograd.grad(out_loop, (f, x, hidden), grad)
+    grads_new = torch.autograd.grad(out_new, (f, x, hidden), grad)
+    max_diff = max((a - b).abs().max().item() for a, b in zip((out_loop, *grads_loop), (out_new, *grads_new)))
+
+    with torch.no_grad():
+        fwd = [time_call(lambda: fn(f, x, hidden), iters, 1) / 1000 for fn in (loop_forget_mult, cpu_forget_mult)]
+    bwd = [time_call(lambda: forward_backward(fn, f, x, hidden), iters, 1) / 1000
+           for fn in (loop_forget_mult, cpu_forget_mult)]
+    print(f'batch {batch_size:>3} hidden {hidden_size:>3} seq {seq_len:>3}: '
+          f'forward loop {fwd[0]:7.2f} ms, new {fwd[1]:7.2f} ms ({fwd[0] / fwd[1]:.1f}x); '
+          f'forward + backward loop {bwd[0]:7.2f} ms, new {bwd[1]:7.2f} ms ({bwd[0] / bwd[1]:.1f}x); '
+          f'max abs diff {max_diff:.1e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU ForgetMult: torchqrnn per-timestep loop vs cpu_forget_mult')
+    parser.add_argument('--iters', type=int, default=10, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    # QRNNActor minibatch and CNN_QRNNActor rollout sizes
+    for batch_size, hidden_size in ((8, 128), (48, 512)):
+        for seq_len in (64, 128, 256, 512):
+            bench(batch_size, hidden_size, seq_len, args.iters)
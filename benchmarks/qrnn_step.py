@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import gym.spaces
+import torch
+from ppo_pytorch.models import QRNNActor
+from ppo_pytorch.models.heads import PolicyHead, StateValueHead
+
+from timing import time_call
+
+
+def head_factory(hidden_size, pd):
+    return dict(probs=PolicyHead(hidden_size, pd), state_value=StateValueHead(hidden_size))
+
+
+def sequence_step(model, states, memory, dones):
+    ac_out, next_memory = model(states.unsqueeze(0), memory, dones.unsqueeze(0))
+    return ac_out.probs[0], ac_out.state_value[0], next_memory
+
+
+def single_step(model, states, memory, dones):
+    ac_out, next_memory = model.step(states, memory, dones)
+    return ac_out.probs, ac_out.state_value, next_memory
+
+
+def rollout(fn, model, states, dones):
+    """Run `fn` over (steps, actors, ...) states carrying memory, as `PPO_QRNN` does"""
+    memory, outputs = None, []
+    for st, d in zip(states, dones):
+        probs, values, memory = fn(model, st, memory, d)
+        outputs.append((probs, values, memory))
+    return outputs
+
+
+def bench(num_actors, obs_size, hidden_size, layers, iters):
+    obs_space = gym.spaces.Box(-1, 1, (obs_size,))
+    model = QRNNActor(obs_space, gym.spaces.Discrete(6), head_factory,
+                      qrnn_hidden_size=hidden_size, qrnn_layers=layers).eval()
+    states = torch.randn(16, num_actors, obs_size)
+    dones = (torch.rand(16, num_actors) < 0.2).float()
+
+    max_diff = max((a - b).abs().max().item()
+                   for out_seq, out_step in zip(rollout(sequence_step, model, states, dones),
+                                                rollout(single_step, model, states, dones))
+                   for a, b in zip(out_seq, out_step))
+
+    memory = torch.randn(layers, num_actors, hidden_size)
+    seq_us, step_us = [time_call(lambda: fn(model, states[0], memory, dones[0]), iters)
+                       for fn in (sequence_step, single_step)]
+    print(f'actors {num_actors:>3} obs {obs_size:>3} hidden {hidden_size:>3} layers {layers}: '
+          f'sequence {seq_us:7.1f} us, step {step_us:7.1f} us ({seq_us / step_us:.2f}x), '
+          f'max abs diff {max_diff:.1e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='QRNNActor rollout latency: length 1 sequence vs step mode')
+    parser.add_argument('--iters', type=int, default=2000, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    with torch.no_grad():
+        for num_actors in (1, 8, 32):
+            for hidden_size, layers in ((128, 3), (512, 2)):
+                bench(num_actors, 64, hidden_size, layers, args.iters)
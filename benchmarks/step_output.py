@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import argparse
+from types import SimpleNamespace
+
+import torch
+from ppo_pytorch.ppo.ppo import PPO
+
+from timing import time_call
+
+
+def separate_transfers(actions, probs, values, logp, sample):
+    # one device to host copy per output, rollout converted from list of numpy arrays
+    sample.actions.append(actions.cpu().numpy())
+    sample.probs.append(probs.cpu().numpy())
+    sample.values.append(values.cpu().numpy())
+    sample.logps.append(logp.cpu().numpy())
+    if len(sample.actions) == horizon + 1:
+        torch.tensor(sample.probs[:-1]), torch.tensor(sample.values), torch.tensor(sample.actions[:-1])
+        torch.tensor(sample.logps[:-1])
+        sample.actions.clear(), sample.probs.clear(), sample.values.clear(), sample.logps.clear()
+
+
+def packed_transfer(actions, probs, values, logp, alg):
+    # `PPO._step` path
+    actions, probs, values, logp = PPO._pack_step_output(alg, actions, probs, values, logp)
+    alg.sample.states.append(None)
+    alg.sample.actions.append(actions), alg.sample.probs.append(probs), alg.sample.values.append(values)
+    alg.sample.logps.append(logp)
+    actions.to(torch.int64, copy=True).numpy()
+    if len(alg.sample.actions) == horizon + 1:
+        torch.stack(alg.sample.probs[:-1]), torch.stack(alg.sample.values), torch.stack(alg.sample.actions[:-1])
+        torch.stack(alg.sample.logps[:-1])
+        alg.sample = PPO.create_new_sample()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PPO step outputs: separate .cpu().numpy() calls vs single packed copy')
+    parser.add_argument('--iters', type=int, default=2000, help='timed steps per measurement')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    horizon = 64
+    device = torch.device(args.device)
+    for num_actors, num_actions in ((1, 6), (16, 6), (64, 18), (256, 18)):
+        probs = torch.randn(num_actors, num_actions, device=device)
+        actions = probs.argmax(-1, keepdim=True)
+        values = torch.randn(num_actors, device=device)
+        logp = torch.randn(num_actors, device=device)
+        sample = SimpleNamespace(actions=[], probs=[], values=[], logps=[])
+        alg = SimpleNamespace(sample=PPO.create_new_sample(), horizon=horizon, device_eval=device, _step_outputs=None)
+        separate_us = time_call(lambda: separate_transfers(actions, probs, values, logp, sample), args.iters)
+        packed_us = time_call(lambda: packed_transfer(actions, probs, values, logp, alg), args.iters)
+        print(f'{args.device} actors {num_actors:>3} actions {num_actions:>2}: separate {separate_us:6.1f} us, '
+              f'packed {packed_us:6.1f} us ({separate_us / packed_us:.2f}x)')
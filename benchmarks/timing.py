@@ -0,0 +1,19 @@
+import time
+
+
+def time_call(fn, iters=1000, warmup=10):
+    """
+    Measure average call latency.
+    Args:
+        fn: Function without arguments.
+        iters: Number of timed calls.
+        warmup: Number of untimed calls before measurement.
+
+    Returns: Average latency in microseconds
+    """
+    for _ in range(warmup):
+        fn()
+    start_time = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start_time) / iters * 1e6
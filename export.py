@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from ppo_pytorch.common import AtariVecEnv, SimpleVecEnv
+from ppo_pytorch.models import export_policy
+from ppo_pytorch.ppo import PPO, create_atari_kwargs, create_fc_kwargs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export trained PPO model to standalone TorchScript policy file, '
+                                                 'which could be loaded by policy_runtime.py')
+    parser.add_argument('--env-name', type=str, metavar='ENV', required=True,
+                        help='gym env name')
+    parser.add_argument('--model-path', type=str, metavar='PATH', required=True,
+                        help='model saved by PPO')
+    parser.add_argument('--output', type=str, metavar='PATH', required=True,
+                        help='exported policy path')
+    parser.add_argument('--atari', action='store_true', default=False,
+                        help='enable for atari envs')
+    args = parser.parse_args()
+
+    # same model parameters as in example.py
+    alg_params = create_atari_kwargs(None) if args.atari else create_fc_kwargs(None)
+    alg_params.update(dict(cuda_eval=False, cuda_train=False, model_init_path=args.model_path))
+
+    env = AtariVecEnv(args.env_name) if args.atari else SimpleVecEnv(args.env_name)
+    alg = PPO(env.observation_space, env.action_space, **alg_params)
+    export_policy(alg.model, args.output, image_observation=alg.image_observation)
+    print('Exported', args.model_path, 'to', args.output)
@@ -0,0 +1,104 @@
+"""
+Minimal runtime for policies saved by `ppo_pytorch.models.export_policy`.
+Depends only on torch and numpy and is kept outside of `ppo_pytorch` package,
+so for deployment copy this file next to your code and import it directly.
+"""
+
+import json
+
+import numpy as np
+import torch
+
+POLICY_FORMAT_VERSION = 1
+
+
+class Policy:
+    def __init__(self, module, metadata):
+        """
+        Exported policy. Use `load_policy` to create it.
+        Args:
+            module: TorchScript module returning (probs, state_value)
+            metadata: Dict stored in policy file by `export_policy`
+        """
+        assert metadata['format_version'] == POLICY_FORMAT_VERSION, metadata['format_version']
+        self.module = module
+        self.metadata = metadata
+        self.observation_shape = tuple(metadata['observation_shape'])
+        self.image_observation = metadata['image_observation']
+        self.pd_params = metadata['pd']
+        self._sample = _samplers[self.pd_params['type']]
+
+    def __call__(self, states, deterministic=False):
+        """
+        Args:
+            states: Observations in same format as passed to `RLBase.eval`
+            deterministic: Take most probable action instead of sampling
+        Returns: Actions in same format as returned by `RLBase.eval`: (N,) for categorical distribution,
+            (N, action_vector_len) otherwise. Actions of `Tuple` spaces are not split into per-space tuples.
+        """
+        probs, _ = self.evaluate(states)
+        return self._sample(probs, self.pd_params, deterministic).numpy()
+
+    def evaluate(self, states):
+        """Returns: (probs, state_value) tensors"""
+        states = np.asarray(states, dtype=np.float32)
+        assert states.shape[1:] == self.observation_shape, f'{states.shape[1:]} {self.observation_shape}'
+        if self.image_observation:
+            states = torch.tensor(states * 255, dtype=torch.uint8)
+        else:
+            states = torch.from_numpy(states)
+        with torch.no_grad():
+            return self.module(states)
+
+
+def load_policy(path) -> Policy:
+    extra_files = {'policy.json': ''}
+    module = torch.jit.load(str(path), map_location='cpu', _extra_files=extra_files)
+    return Policy(module, json.loads(extra_files['policy.json']))
+
+
+def _sample_categorical(probs, params, deterministic):
+    if deterministic:
+        return probs.argmax(-1)
+    return torch.softmax(probs, -1).multinomial(1).squeeze(-1)
+
+
+def _sample_multi_categorical(probs, params, deterministic):
+    logits = probs.split(params['sizes'], -1)
+    if deterministic:
+        return torch.stack([x.argmax(-1) for x in logits], -1)
+    return torch.cat([torch.softmax(x, -1).multinomial(1) for x in logits], -1)
+
+
+def _sample_bernoulli(probs, params, deterministic):
+    # same dtype as `BernoulliPd.dtype`
+    p = probs.sigmoid()
+    return (p > 0.5).long() if deterministic else p.bernoulli().long()
+
+
+def _sample_diag_gaussian(probs, params, deterministic):
+    mean, logstd = probs.split(params['d'], -1)
+    return mean if deterministic else mean + logstd.exp() * torch.randn_like(mean)
+
+
+def _sample_fixed_std_gaussian(probs, params, deterministic):
+    mean = probs[..., :params['d']]
+    return mean if deterministic else mean + params['std'] * torch.randn_like(mean)
+
+
+def _sample_multivec_gaussian(probs, params, deterministic):
+    vecs = probs.reshape(-1, params['d'], params['num_vec'])
+    if deterministic:
+        return vecs.mean(-1)
+    index = torch.randint(params['num_vec'], size=(vecs.shape[0],))
+    return vecs[torch.arange(vecs.shape[0]), :, index]
+
+
+_samplers = dict(
+    categorical=_sample_categorical,
+    multi_categorical=_sample_multi_categorical,
+    bernoulli=_sample_bernoulli,
+    diag_gaussian=_sample_diag_gaussian,
+    fixed_std_gaussian=_sample_fixed_std_gaussian,
+    multivec_gaussian=_sample_multivec_gaussian,
+)
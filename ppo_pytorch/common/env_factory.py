@@ -1,3 +1,5 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from multiprocessing.dummy import Pool
 
@@ -11,14 +13,38 @@ from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
 from .atari_wrappers import NoopResetEnv, MaxAndSkipEnv, EpisodicLifeEnv, FireResetEnv, ScaledFloatFrame, ClipRewardEnv, \
     FrameStack
 from .monitor import Monitor
-from .sonic_utils import SonicDiscretizer, AllowBacktracking, ChangeStateAtRestart
+from .step_profiler import StepProfiler
+from .sonic_utils import SonicDiscretizer, AllowBacktracking, ChangeStateAtRestart, savestate_cache
 from .sonic_utils import sonic_1_train_levels, sonic_2_train_levels, sonic_3_train_levels
 
 
+def _no_wrap(env):
+    return env
+
+
+def _step_profile_wrappers(step_profile_interval):
+    """
+    Returns: Functions to wrap each layer of env and outermost layer with `StepProfiler`.
+        Both functions do nothing if `step_profile_interval` is None.
+    """
+    if step_profile_interval is None:
+        return _no_wrap, _no_wrap
+    profiler = StepProfiler(step_profile_interval)
+    return profiler.wrap, profiler.finish
+
+
 class NamedVecEnv:
-    def __init__(self, env_name, dummy=True):
+    def __init__(self, env_name, dummy=True, step_profile_interval=None):
+        """
+        Args:
+            env_name: Env name
+            dummy: Run envs in main process using `DummyVecEnv` instead of `SubprocVecEnv`
+            step_profile_interval: Time each env wrapper and report summary every `step_profile_interval` steps
+                in `info['step_profile']`. None to disable.
+        """
         self.env_name = env_name
         self.dummy = dummy
+        self.step_profile_interval = step_profile_interval
         self.subproc_envs = None
         self.num_envs = None
 
@@ -45,67 +71,91 @@ class NamedVecEnv:
 
 class AtariVecEnv(NamedVecEnv):
     def __init__(self, env_name, episode_life=True, scale=True, clip_rewards=True,
-                 frame_stack=True, grayscale=True, dummy=True):
+                 frame_stack=True, grayscale=True, dummy=True, prewarm_reset=False, step_profile_interval=None):
+        """
+        Args:
+            prewarm_reset: Reset spare emulator in background thread, so game over step
+                returns new episode observation without waiting for no-op reset. Doubles emulators count.
+        """
+        self.prewarm_reset = prewarm_reset
         self.scale = scale
         self.clip_rewards = clip_rewards
         self.episode_life = episode_life
         self.frame_stack = frame_stack
         self.grayscale = grayscale
-        super().__init__(env_name, dummy)
+        super().__init__(env_name, dummy, step_profile_interval)
 
     def get_env_fn(self):
-        def make(env_name, episode_life, scale, clip_rewards, frame_stack, grayscale):
-            env = gym.make(env_name)
+        def make_core(env_name, wrap=_no_wrap):
+            env = wrap(gym.make(env_name))
             assert 'NoFrameskip' in env.spec.id
-            env = NoopResetEnv(env, noop_max=30)
-            env = MaxAndSkipEnv(env, skip=4)
-            env = Monitor(env)
+            env = wrap(NoopResetEnv(env, noop_max=30))
+            env = wrap(MaxAndSkipEnv(env, skip=4))
+            return env
+
+        def make(env_name, episode_life, scale, clip_rewards, frame_stack, grayscale, prewarm_reset,
+                 step_profile_interval):
+            wrap, finish = _step_profile_wrappers(step_profile_interval)
+            if prewarm_reset:
+                # envs are swapped on reset, so emulator and its wrappers are timed together
+                env = wrap(PrewarmedResetEnv(make_core(env_name), partial(make_core, env_name)))
+            else:
+                env = make_core(env_name, wrap)
+            env = wrap(Monitor(env))
             if episode_life:
-                env = EpisodicLifeEnv(env)
+                env = wrap(EpisodicLifeEnv(env))
             if 'FIRE' in env.unwrapped.get_action_meanings():
-                env = FireResetEnv(env)
-            env = SimplifyFrame(env, 84, grayscale)
-            env = ChannelTranspose(env)
+                env = wrap(FireResetEnv(env))
+            env = wrap(SimplifyFrame(env, 84, grayscale))
+            env = wrap(ChannelTranspose(env))
             if scale:
-                env = ScaledFloatFrame(env)
+                env = wrap(ScaledFloatFrame(env))
             if clip_rewards:
-                env = ClipRewardEnv(env)
+                env = wrap(ClipRewardEnv(env))
             if frame_stack:
-                env = FrameStack(env, 4)
-            return env
-        return partial(make, self.env_name, self.episode_life, self.scale, self.clip_rewards, self.frame_stack, self.grayscale)
+                env = wrap(FrameStack(env, 4))
+            return finish(env)
+        return partial(make, self.env_name, self.episode_life, self.scale, self.clip_rewards, self.frame_stack,
+                       self.grayscale, self.prewarm_reset, self.step_profile_interval)
 
 
 class SonicVecEnv(NamedVecEnv):
-    def __init__(self, game, state, scale=True, frame_stack=False, grayscale=True):
+    def __init__(self, game, state, scale=True, frame_stack=False, grayscale=True, step_profile_interval=None):
         self.scale = scale
         self.state = state
         self.frame_stack = frame_stack
         self.grayscale = grayscale
-        super().__init__(game)
+        super().__init__(game, step_profile_interval=step_profile_interval)
 
     def get_env_fn(self):
-        def make(game, state, scale, frame_stack, grayscale):
+        def make(game, state, scale, frame_stack, grayscale, step_profile_interval):
             from retro_contest.local import make
-            env = make(game, state)
-            env = Monitor(env)
-            env = SonicDiscretizer(env)
-            env = AllowBacktracking(env)
-            env = Monitor(env)
-            env = SimplifyFrame(env, 84, grayscale)
-            env = ChannelTranspose(env)
+            wrap, finish = _step_profile_wrappers(step_profile_interval)
+            env = wrap(make(game, state))
+            env = wrap(Monitor(env))
+            env = wrap(SonicDiscretizer(env))
+            env = wrap(AllowBacktracking(env))
+            env = wrap(Monitor(env))
+            env = wrap(SimplifyFrame(env, 84, grayscale))
+            env = wrap(ChannelTranspose(env))
             if scale:
-                env = ScaledFloatFrame(env)
+                env = wrap(ScaledFloatFrame(env))
             if frame_stack:
-                env = FrameStack(env, 4)
-            return env
-        return partial(make, self.env_name, self.state, self.scale, self.frame_stack, self.grayscale)
+                env = wrap(FrameStack(env, 4))
+            return finish(env)
+        return partial(make, self.env_name, self.state, self.scale, self.frame_stack, self.grayscale,
+                       self.step_profile_interval)
 
 
 class JointSonicVecEnv:
     sonic_names = ('SonicTheHedgehog-Genesis', 'SonicTheHedgehog2-Genesis', 'SonicAndKnuckles3-Genesis')
 
-    def __init__(self, states='train', scale=True, frame_stack=False, grayscale=True):
+    def __init__(self, states='train', scale=True, frame_stack=False, grayscale=True, savestate_cache_max_bytes=None):
+        """
+        Args:
+            states: Savestates for each of three games or 'train' for `sonic_*_train_levels`
+            savestate_cache_max_bytes: Memory limit of per-process decompressed savestate cache. None for unlimited.
+        """
         if states == 'train':
             states = [sonic_1_train_levels, sonic_2_train_levels, sonic_3_train_levels]
         assert len(states) == 3
@@ -113,6 +163,7 @@ class JointSonicVecEnv:
         self.scale = scale
         self.frame_stack = frame_stack
         self.grayscale = grayscale
+        self.savestate_cache_max_bytes = savestate_cache_max_bytes
         self.env_name = 'Sonic123'
         self.pool = Pool(3)
         self.subproc_envs = None
@@ -124,8 +175,9 @@ class JointSonicVecEnv:
         env.close()
 
     def get_env_fn(self, game, states):
-        def make(game, states, scale, frame_stack, grayscale):
+        def make(game, states, scale, frame_stack, grayscale, savestate_cache_max_bytes):
             from retro_contest.local import make
+            savestate_cache.max_bytes = savestate_cache_max_bytes
             env = make(game, states[0])
             env = Monitor(env)
             env = SonicDiscretizer(env)
@@ -139,7 +191,8 @@ class JointSonicVecEnv:
             if frame_stack:
                 env = FrameStack(env, 4)
             return env
-        return partial(make, game, states, self.scale, self.frame_stack, self.grayscale)
+        return partial(make, game, states, self.scale, self.frame_stack, self.grayscale,
+                       self.savestate_cache_max_bytes)
 
     def set_num_envs(self, num_envs):
         assert num_envs % 3 == 0
@@ -164,11 +217,56 @@ class JointSonicVecEnv:
 
 class SimpleVecEnv(NamedVecEnv):
     def get_env_fn(self):
-        def make(env_name):
-            env = gym.make(env_name)
-            env = Monitor(env)
-            return env
-        return partial(make, self.env_name)
+        def make(env_name, step_profile_interval):
+            wrap, finish = _step_profile_wrappers(step_profile_interval)
+            env = wrap(gym.make(env_name))
+            env = wrap(Monitor(env))
+            return finish(env)
+        return partial(make, self.env_name, self.step_profile_interval)
+
+
+class PrewarmedResetEnv(gym.Wrapper):
+    def __init__(self, env, env_fn):
+        """
+        Keeps spare env which is reset in background thread while main env is running.
+        On reset envs are swapped and already prepared observation is returned.
+        Reset with keyword arguments is done synchronously on main env, so they apply to the episode it starts.
+        Time spent waiting for reset is added to `info['reset_stall']` on first step after it.
+        Args:
+            env: Main env
+            env_fn: Creates spare env of same type as `env`
+        """
+        super().__init__(env)
+        self._spare_env = env_fn()
+        self._executor = ThreadPoolExecutor(1)
+        self._spare_reset = self._executor.submit(self._spare_env.reset)
+        self._reset_stall = None
+
+    def reset(self, **kwargs):
+        start_time = time.time()
+        if len(kwargs) != 0:
+            obs = self.env.reset(**kwargs)
+        else:
+            obs = self._spare_reset.result()
+            self.env, self._spare_env = self._spare_env, self.env
+            self._spare_reset = self._executor.submit(self._spare_env.reset)
+        self._reset_stall = time.time() - start_time
+        return obs
+
+    def step(self, action):
+        state, reward, done, info = self.env.step(action)
+        if self._reset_stall is not None:
+            info['reset_stall'] = self._reset_stall
+            self._reset_stall = None
+        return state, reward, done, info
+
+    def close(self):
+        self._executor.shutdown()
+        self._spare_env.close()
+        return self.env.close()
+
+    def _warn_double_wrap(self):
+        pass
 
 
 class ChannelTranspose(gym.ObservationWrapper):
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+
+# columns of episode records written by `EpisodeRecorder`
+EPISODE_COLUMNS = (('reward', np.float32), ('len', np.int32), ('actor', np.int32), ('frame', np.int64))
+
+
+class EpisodeStats:
+    def __init__(self, num_actors, window=100, quantiles=(5, 50, 95)):
+        """
+        Streaming statistics of finished episodes. Episodes are added in O(1) to preallocated arrays.
+        Args:
+            num_actors: Number of parallel envs.
+            window: Number of last episodes used for reward mean, std and quantiles.
+            quantiles: Percentiles of reward over window.
+        """
+        self.window = window
+        self.quantiles = quantiles
+        self.episode = 0
+        self.episode_counts = np.zeros(num_actors, dtype=np.int64)
+        self._window_rewards = np.zeros(window)
+        self._window_index = 0
+        self._window_sum = 0.0
+        self._window_sum_squares = 0.0
+        # [count, episode, frame, len, reward] sums of episodes since last `interval_summary`
+        self._interval_sums = [0, 0, 0, 0, 0.0]
+        # [count, reward] sums of original rewards since last `interval_summary`
+        self._orig_sums = [0, 0.0]
+        # (reward, len, episode, frame) of last episode
+        self.last = None
+
+    @property
+    def window_size(self):
+        return min(self.episode, self.window)
+
+    @property
+    def new_episodes(self):
+        """Number of episodes since last `interval_summary`"""
+        return self._interval_sums[0]
+
+    def add(self, actor, reward, length, frame):
+        """Add finished episode of `actor`"""
+        # sums are python scalars, which are much faster to update one by one than numpy ones
+        reward = float(reward)
+        index = self._window_index
+        if self.episode >= self.window:
+            evicted = self._window_rewards.item(index)
+            self._window_sum -= evicted
+            self._window_sum_squares -= evicted * evicted
+        self._window_rewards[index] = reward
+        self._window_sum += reward
+        self._window_sum_squares += reward * reward
+        self._window_index = index = index + 1 if index + 1 != self.window else 0
+        if index == 0:
+            # drop rounding errors accumulated by subtraction once per window
+            self._window_sum = float(self._window_rewards.sum())
+            self._window_sum_squares = float(np.dot(self._window_rewards, self._window_rewards))
+        self.last = (reward, length, self.episode, frame)
+        sums = self._interval_sums
+        sums[0] += 1
+        sums[1] += self.episode
+        sums[2] += frame
+        sums[3] += length
+        sums[4] += reward
+        self.episode_counts[actor] += 1
+        self.episode += 1
+
+    def add_orig(self, reward):
+        """Add reward of finished episode before reward wrappers"""
+        self._orig_sums[0] += 1
+        self._orig_sums[1] += reward
+
+    def window_summary(self):
+        """Returns: (mean, std, percentiles) of rewards of last `window` episodes"""
+        size = self.window_size
+        mean = self._window_sum / size
+        std = np.sqrt(max(self._window_sum_squares / size - mean * mean, 0))
+        # same linear interpolation as `np.percentile`, which has much larger constant overhead
+        rewards = np.sort(self._window_rewards[:size])
+        pos = np.asarray(self.quantiles, dtype=np.float64) * ((size - 1) / 100)
+        low = pos.astype(np.int64)
+        high = np.minimum(low + 1, size - 1)
+        percentiles = rewards[low] + (rewards[high] - rewards[low]) * (pos - low)
+        return mean, std, percentiles
+
+    def interval_summary(self):
+        """
+        Returns: (avg episode index, avg frame, avg len, avg reward, avg orig reward or None) of episodes
+            since last call.
+        """
+        count, *sums = self._interval_sums
+        avg_ep, avg_frame, avg_len, avg_r = [x / count for x in sums]
+        orig_count, orig_sum = self._orig_sums
+        avg_r_orig = orig_sum / orig_count if orig_count != 0 else None
+        self._interval_sums = [0, 0, 0, 0, 0.0]
+        self._orig_sums = [0, 0.0]
+        return avg_ep, avg_frame, avg_len, avg_r, avg_r_orig
+
+
+class EpisodeRecorder:
+    def __init__(self, path, chunk_size=1024):
+        """
+        Appends episode records to binary column files `{path}/{column}.bin`, see `EPISODE_COLUMNS`.
+            Records are buffered in lists, which are faster to append to one by one than numpy arrays,
+            and written in chunks. Use `read_episodes` to load them.
+        Args:
+            path: Output directory.
+            chunk_size: Number of buffered records.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self._columns = [[] for _ in EPISODE_COLUMNS]
+        self._files = [open(os.path.join(path, f'{name}.bin'), 'ab') for name, _ in EPISODE_COLUMNS]
+
+    def append(self, reward, length, actor, frame):
+        """Append record of finished episode"""
+        rewards, lengths, actors, frames = self._columns
+        rewards.append(reward)
+        lengths.append(length)
+        actors.append(actor)
+        frames.append(frame)
+        if len(rewards) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records"""
+        for (_, dtype), column, file in zip(EPISODE_COLUMNS, self._columns, self._files):
+            np.asarray(column, dtype).tofile(file)
+            column.clear()
+            file.flush()
+
+    def close(self):
+        self.flush()
+        for file in self._files:
+            file.close()
+
+
+def read_episodes(path):
+    """Returns: Dict of column name to array of episode records written by `EpisodeRecorder` to `path`"""
+    return {name: np.fromfile(os.path.join(path, f'{name}.bin'), dtype) for name, dtype in EPISODE_COLUMNS}
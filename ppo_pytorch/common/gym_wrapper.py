@@ -4,6 +4,7 @@ from typing import Callable
 
 import numpy as np
 
+from .profile_trigger import ProfileTrigger
 from .tensorboard_env_logger import TensorboardEnvLogger
 
 
@@ -13,7 +14,10 @@ class GymWrapper:
                  env_factory: Callable,
                  log_time_interval=5,
                  log_path=None,
-                 tag=''):
+                 tag='',
+                 profile_steps=None,
+                 profile_updates=2,
+                 profile_signal=None):
         """
         Simplifies training of RL algorithms with gym environments.
         Args:
@@ -22,7 +26,15 @@ class GymWrapper:
                 Accepted values are environment name, function which returns `gym.Env`, `gym.Env` object
             log_time_interval: Tensorboard logging interval in seconds.
             log_path: Tensorboard output directory.
+            profile_steps: Number of env steps captured to `torch.profiler` trace in tensorboard run directory
+                after `profile` file is created there or `profile_signal` is received. None disables limit.
+            profile_updates: Number of training updates captured to trace. None disables limit.
+                At least one of `profile_steps` and `profile_updates` must be set.
+            profile_signal: Signal which also starts capture, for example `signal.SIGUSR1`.
+                Its previous Python handler is still called. None to not handle signals.
         """
+        if profile_steps is None and profile_updates is None:
+            raise ValueError('profile_steps and profile_updates are both None, trace capture would never stop')
         self._init_args = locals()
         self.rl_alg_factory = rl_alg_factory
         self.env = env_factory()
@@ -39,15 +51,20 @@ class GymWrapper:
             self.logger = TensorboardEnvLogger(alg_name, env_name, log_path, self.env.num_envs, log_time_interval, tag=tag)
             self.logger.add_text('GymWrapper', pprint.pformat(self._init_args))
             self.rl_alg.logger = self.logger
+            self.profile_trigger = ProfileTrigger(self.logger.run_path, self.rl_alg.timer,
+                                                  profile_steps, profile_updates, signal_num=profile_signal)
+            self.rl_alg.profile_trigger = self.profile_trigger
         else:
             self.logger = None
+            self.profile_trigger = None
 
     def step(self, always_log=False):
         """Do single step of RL alg"""
 
         # evaluate RL alg
         actions = self.rl_alg.eval(self.states)
-        self.states, rewards, dones, infos = self.env.step(actions)
+        with self.rl_alg.timer.span('env step'):
+            self.states, rewards, dones, infos = self.env.step(actions)
         self.states, rewards, dones = [np.asarray(v) for v in (self.states, rewards, dones)]
 
         # process step results
@@ -63,7 +80,10 @@ class GymWrapper:
         self.frame += self.env.num_envs
         # logger step
         if self.logger is not None:
-            self.logger.step(infos, always_log)
+            with self.rl_alg.timer.span('logging'):
+                self.logger.step(infos, always_log)
+        if self.profile_trigger is not None:
+            self.profile_trigger.step(self.frame)
 
     def train(self, max_frames):
         """Train for specified number of frames and return episode info"""
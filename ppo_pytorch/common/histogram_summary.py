@@ -0,0 +1,63 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+# same fields as arguments of `SummaryWriter.add_histogram_raw`
+HistogramSummary = namedtuple('HistogramSummary', 'min, max, num, sum, sum_squares, bucket_limits, bucket_counts')
+
+# subsamples are drawn from own generator of each device, so logging doesn't change random stream of training
+_generators = {}
+
+
+def histogram_summary(values, bins=64, max_elements=None) -> HistogramSummary or None:
+    """
+    Compute fixed-bin histogram and moments of `values` with torch ops on its own device,
+        so only compact summary is transferred to host and written.
+    Args:
+        values: Tensor or numpy array of any shape.
+        bins: Number of equal width bins between min and max.
+        max_elements: If `values` has more elements, histogram counts are estimated from random subsample.
+            Min, max and moments are always computed from all values.
+    Returns: `HistogramSummary` or None if `values` have no finite elements.
+    """
+    if not torch.is_tensor(values):
+        values = torch.from_numpy(np.asarray(values, dtype=np.float32))
+    x = values.detach().reshape(-1).float()
+    if x.numel() == 0:
+        return None
+    summary = _summarize(x, bins, max_elements)
+    if not math.isfinite(summary[0]) or not math.isfinite(summary[1]):
+        x = x[torch.isfinite(x)]
+        if x.numel() == 0:
+            return None
+        summary = _summarize(x, bins, max_elements)
+    x_min, x_max, x_sum, x_sum_squares = summary[:4]
+    if x_min == x_max:
+        bucket_limits, bucket_counts = [x_max], [x.numel()]
+    else:
+        bucket_limits = np.linspace(x_min, x_max, bins + 1)[1:].tolist()
+        bucket_counts = summary[4:]
+    return HistogramSummary(x_min, x_max, x.numel(), x_sum, x_sum_squares, bucket_limits, bucket_counts)
+
+
+def _summarize(x, bins, max_elements):
+    """Returns: [min, max, sum, sum of squares, *bucket counts] list, with single device to host transfer"""
+    sample = x
+    if max_elements is not None and x.numel() > max_elements:
+        index = torch.randint(x.numel(), (max_elements,), device=x.device, generator=_generator(x.device))
+        sample = x[index]
+    x_min, x_max = x.min(), x.max()
+    scale = bins / (x_max - x_min).clamp(min=1e-30)
+    index = ((sample - x_min) * scale).long().clamp_(0, bins - 1)
+    counts = torch.bincount(index, minlength=bins).float() * (x.numel() / sample.numel())
+    return torch.cat([torch.stack([x_min, x_max, x.sum(), x.pow(2).sum()]), counts]).tolist()
+
+
+def _generator(device):
+    generator = _generators.get(device)
+    if generator is None:
+        generator = _generators[device] = torch.Generator(device)
+        generator.manual_seed(0)
+    return generator
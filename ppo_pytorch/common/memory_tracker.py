@@ -0,0 +1,149 @@
+import gc
+import sys
+import warnings
+
+import numpy as np
+import torch
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 ** 2
+
+
+class MemoryTracker:
+    def __init__(self, enabled=True, budget=None, warn_fraction=0.9):
+        """
+        Tracks memory usage of training loop phases and byte sizes of buffers.
+            Phase is interval between consecutive `mark` calls. For each phase peak RSS is recorded
+            and, if CUDA is used, peak of allocated CUDA memory. Values are max over phases since last report.
+        Args:
+            enabled: If False, nothing is measured.
+            budget: RSS limit in bytes. Warning is issued when peak RSS of phase exceeds `warn_fraction` of it.
+            warn_fraction: Fraction of `budget` at which warning is issued.
+        """
+        self.enabled = enabled
+        self.budget = budget
+        self.warn_fraction = warn_fraction
+        self._over_budget = False
+        self._stats = {}
+        # without per-phase peak reset, peak RSS is process lifetime peak
+        self._can_reset_peak = enabled and _reset_peak_rss()
+
+    def mark(self, phase, live_tensors=False):
+        """
+        Record memory usage of `phase` which ends now.
+        Args:
+            phase: Phase name.
+            live_tensors: Also record bytes of all tensors alive at end of phase by device.
+                Requires scan of all objects tracked by `gc`, which could take tens of milliseconds.
+        """
+        if not self.enabled:
+            return
+        peak = _peak_rss()
+        if peak is not None:
+            self._set_max(f'memory peak rss MB {phase}', peak / MB)
+            self._check_budget(phase, peak)
+            if self._can_reset_peak:
+                _reset_peak_rss()
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            self._set_max(f'memory cuda peak MB {phase}', torch.cuda.max_memory_allocated() / MB)
+            torch.cuda.reset_peak_memory_stats()
+        if live_tensors:
+            for device, size in live_tensor_bytes().items():
+                self._stats[f'memory live tensors MB {phase} {device}'] = size / MB
+
+    def add_size(self, name, value):
+        """Record byte size of tensors and numpy arrays in `value`, see `tensor_bytes`"""
+        if self.enabled:
+            self.add_bytes(name, tensor_bytes(value))
+
+    def add_bytes(self, name, size):
+        """Record size in bytes"""
+        if self.enabled:
+            self._stats[f'memory MB {name}'] = size / MB
+
+    def report(self):
+        """Returns: Dict of scalars in megabytes recorded since last report."""
+        stats, self._stats = self._stats, {}
+        return stats
+
+    def _set_max(self, name, value):
+        self._stats[name] = max(self._stats.get(name, value), value)
+
+    def _check_budget(self, phase, peak):
+        if self.budget is None:
+            return
+        limit = self.warn_fraction * self.budget
+        if peak >= limit and not self._over_budget:
+            warnings.warn(f'Peak RSS {peak / MB:.0f} MB during {phase} exceeds {self.warn_fraction:.0%} '
+                          f'of memory budget {self.budget / MB:.0f} MB', RuntimeWarning)
+        # warn again only after usage goes noticeably below limit, not on every phase near it
+        self._over_budget = peak >= 0.95 * limit if self._over_budget else peak >= limit
+
+
+def tensor_bytes(value, _seen=None) -> int:
+    """
+    Returns: Total bytes of storages of tensors and numpy arrays in `value`,
+        which could be nested in lists, tuples and dicts. Storage shared by several views is counted once.
+    """
+    seen = set() if _seen is None else _seen
+    if isinstance(value, torch.Tensor):
+        storage = value.untyped_storage()
+        key = (storage.data_ptr(), str(value.device))
+        if key in seen:
+            return 0
+        seen.add(key)
+        return storage.nbytes()
+    if isinstance(value, np.ndarray):
+        while isinstance(value.base, np.ndarray):
+            value = value.base
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        return value.nbytes
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return 0
+    return sum(tensor_bytes(v, seen) for v in value)
+
+
+def live_tensor_bytes():
+    """Returns: Dict of device type to bytes of storages of all alive tensors"""
+    seen = set()
+    sizes = {}
+    for obj in gc.get_objects():
+        # `isinstance` could trigger lazy imports of module proxies
+        if issubclass(type(obj), torch.Tensor):
+            size = tensor_bytes(obj, seen)
+            sizes[obj.device.type] = sizes.get(obj.device.type, 0) + size
+    return sizes
+
+
+def _peak_rss():
+    """Returns: Peak RSS in bytes since last `_reset_peak_rss` or process start, None if unknown"""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _reset_peak_rss():
+    """Reset peak RSS of process, supported only on Linux. Returns: True on success."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
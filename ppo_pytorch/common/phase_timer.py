@@ -0,0 +1,134 @@
+import time
+from collections import deque
+
+import numpy as np
+import torch
+
+
+class PhaseTimer:
+    def __init__(self, enabled=True, max_samples=10000):
+        """
+        Measures wall-clock time of nested named spans of training loop.
+            Span name in report is path of names of enclosing spans, e.g. 'eval/train/update/backward'.
+            Time is measured on host, asynchronous CUDA work is attributed to span which waits for it.
+        Args:
+            enabled: If False, `span` returns shared no-op context and nothing is measured.
+            max_samples: Number of last durations of each span used for percentiles.
+        """
+        self.enabled = enabled
+        # add spans to running `torch.profiler` trace as `record_function` ranges, even if timing is disabled
+        self.annotate = False
+        self.max_samples = max_samples
+        self._stack = []
+        self._spans = {}
+        self._paths = {}
+        self._durations = {}
+        self._totals = {}
+        self._counts = {}
+        self._last_report_time = time.perf_counter()
+
+    def span(self, name):
+        """Context manager which measures time of enclosed code"""
+        if self.annotate:
+            return _AnnotatedSpan(self, name)
+        if not self.enabled:
+            return _null_span
+        span = self._spans.get(name)
+        if span is None:
+            span = self._spans[name] = _Span(self, name)
+        return span
+
+    def add_count(self, name, count=1):
+        """Count processed items, e.g. frames, reported as `name` per second"""
+        if self.enabled:
+            self._counts[name] = self._counts.get(name, 0) + count
+
+    def report(self):
+        """
+        Returns: Dict of scalars since last report: count rates, share of wall-clock time
+            and 50th / 95th percentile of durations of each span. Empty if disabled.
+        """
+        if not self.enabled:
+            return {}
+        cur_time = time.perf_counter()
+        elapsed = max(cur_time - self._last_report_time, 1e-9)
+        self._last_report_time = cur_time
+        # time of spans which are still running is split between reports
+        for span in self._stack:
+            self._totals[span[0]] += cur_time - span[2]
+            span[2] = cur_time
+        res = {f'{name} per second': count / elapsed for name, count in self._counts.items()}
+        for path, durations in self._durations.items():
+            if len(durations) == 0:
+                continue
+            p50, p95 = np.percentile(np.array(durations) * 1000, (50, 95))
+            res[f'time share {path}'] = self._totals[path] / elapsed
+            res[f'time p50 ms {path}'] = p50
+            res[f'time p95 ms {path}'] = p95
+            durations.clear()
+            self._totals[path] = 0
+        self._counts.clear()
+        return res
+
+    def _enter(self, name):
+        parent = self._stack[-1][0] if len(self._stack) != 0 else None
+        path = self._paths.get((parent, name))
+        if path is None:
+            path = self._paths[(parent, name)] = name if parent is None else f'{parent}/{name}'
+            self._durations[path] = deque(maxlen=self.max_samples)
+            self._totals[path] = 0
+        start_time = time.perf_counter()
+        # [path, start time, start of time not yet added to totals]
+        self._stack.append([path, start_time, start_time])
+
+    def _exit(self):
+        path, start_time, total_start_time = self._stack.pop()
+        cur_time = time.perf_counter()
+        self._durations[path].append(cur_time - start_time)
+        self._totals[path] += cur_time - total_start_time
+
+
+class _Span:
+    __slots__ = ('_timer', '_name')
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self):
+        self._timer._enter(self._name)
+
+    def __exit__(self, *exc):
+        self._timer._exit()
+
+
+class _AnnotatedSpan:
+    __slots__ = ('_timer', '_name', '_record')
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+        self._record = torch.profiler.record_function(name)
+
+    def __enter__(self):
+        self._record.__enter__()
+        if self._timer.enabled:
+            self._timer._enter(self._name)
+
+    def __exit__(self, *exc):
+        if self._timer.enabled:
+            self._timer._exit()
+        self._record.__exit__(*exc)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_null_span = _NullSpan()
@@ -2,6 +2,7 @@
 # https://github.com/openai/baselines/blob/master/baselines/common/distributions.py
 
 import math
+from collections import namedtuple
 
 import gym.spaces
 import numpy as np
@@ -19,10 +20,77 @@ def make_pd(space: gym.Space):
         return DiagGaussianPd(space.shape[0])
     elif isinstance(space, gym.spaces.MultiBinary):
         return BernoulliPd(space.n)
+    elif isinstance(space, gym.spaces.MultiDiscrete):
+        return MultiCategoricalPd(space.nvec)
+    elif isinstance(space, gym.spaces.Tuple):
+        return MultiCategoricalPd(_discrete_sizes(space))
     else:
         raise TypeError(space)
 
 
+def _discrete_sizes(space: gym.Space):
+    """Number of actions in each dimension of discrete space"""
+    if isinstance(space, gym.spaces.Discrete):
+        return [space.n]
+    elif isinstance(space, gym.spaces.MultiDiscrete):
+        return list(space.nvec)
+    elif isinstance(space, gym.spaces.Tuple):
+        return [n for s in space.spaces for n in _discrete_sizes(s)]
+    else:
+        raise TypeError(space)
+
+
+DistributionStats = namedtuple('DistributionStats', 'logp, logp_old, entropy, kl')
+
+
+def _uniform(shape, device, generator):
+    """Uniform noise in (0, 1), safe to take logarithm"""
+    tiny = torch.finfo(torch.float).tiny
+    return torch.empty(shape, device=device).uniform_(tiny, 1, generator=generator)
+
+
+def _gumbel_noise(shape, device=None, generator=None):
+    """Standard Gumbel noise. argmax(logits + noise) is a sample from categorical distribution."""
+    return _uniform(shape, device, generator).log_().neg_().log_().neg_()
+
+
+def _logistic_noise(shape, device=None, generator=None):
+    """Standard logistic noise. (logits + noise > 0) is a sample from bernoulli distribution."""
+    u = _uniform(shape, device, generator)
+    return u.log() - u.neg_().log1p_()
+
+
+class NoiseBuffer:
+    def __init__(self, size=1 << 16, generator=None):
+        """
+        Random noise generated in bulk, so sampling actions for few actors
+        doesn't pay overhead of separate random generator call each step.
+        Args:
+            size: Number of pregenerated values of each noise type.
+            generator: `torch.Generator` for reproducible noise.
+        """
+        self.size = size
+        self.generator = generator
+        self._buffers = {}
+
+    def gumbel(self, shape: torch.Size, device):
+        return self._take(_gumbel_noise, shape, device)
+
+    def logistic(self, shape: torch.Size, device):
+        return self._take(_logistic_noise, shape, device)
+
+    def _take(self, noise_fn, shape, device):
+        """Returns view of buffer. It is overwritten after refill, so result should be used immediately."""
+        numel = shape.numel()
+        if numel > self.size:
+            return noise_fn(shape, device, self.generator)
+        buffer, pos = self._buffers.get(noise_fn, (None, self.size))
+        if pos + numel > self.size or buffer.device != device:
+            buffer, pos = noise_fn(self.size, device, self.generator), 0
+        self._buffers[noise_fn] = buffer, pos + numel
+        return buffer[pos: pos + numel].view(shape)
+
+
 class ProbabilityDistribution:
     """Unified API to work with different types of probability distributions"""
     @property
@@ -59,17 +127,53 @@ class ProbabilityDistribution:
         """Log probability"""
         raise NotImplementedError
 
-    def sample(self, prob):
-        """Sample action from probabilities"""
+    def stats(self, a, prob, prob_old, logp_old=None):
+        """
+        All statistics needed by PPO loss. Subclasses compute shared intermediates only once.
+        Args:
+            a: Actions
+            prob: Current policy output
+            prob_old: Policy output used to sample `a`
+            logp_old: `logp(a, prob_old)` returned by `sample_with_logp`, so it isn't recomputed.
+        Returns: `DistributionStats` with `logp(a, prob)`, `logp(a, prob_old)`,
+            `entropy(prob)` and `kl(prob_old, prob)`
+        """
+        if logp_old is None:
+            logp_old = self.logp(a, prob_old)
+        return DistributionStats(self.logp(a, prob), logp_old, self.entropy(prob), self.kl(prob_old, prob))
+
+    def sample(self, prob, noise=None, generator=None):
+        """
+        Sample action from probabilities
+        Args:
+            prob: Policy output
+            noise: `NoiseBuffer` to take random values from. Distributions which don't support it ignore it.
+            generator: `torch.Generator` used when `noise` is None or isn't used.
+        """
         return self.sample_with_random(prob, None)[0]
 
     def sample_with_random(self, prob, rand):
         raise NotImplementedError()
 
+    def sample_with_logp(self, prob, noise=None, generator=None):
+        """
+        Sample actions together with their log probabilities. Arguments are same as in `sample`.
+        Returns: (actions, logp)
+        """
+        actions = self.sample(prob, noise, generator)
+        return actions, self.logp(actions, prob)
+
     def to_inputs(self, action):
         """Convert actions to neural network input vector. For example, class number to one-hot vector."""
         return action
 
+    def export_params(self):
+        """
+        Returns: JSON serializable dict with distribution 'type' and its parameters.
+            Used by `policy_runtime` to sample actions without this module.
+        """
+        raise NotImplementedError
+
     @property
     def init_column_norm(self):
         return 0.01
@@ -119,8 +223,25 @@ class CategoricalPd(ProbabilityDistribution):
         po = ea / z
         return torch.sum(po * (torch.log(z) - a), dim=-1)
 
-    def sample(self, prob):
-        return F.softmax(prob, dim=-1).multinomial(1)
+    def stats(self, a, prob, prob_old, logp_old=None):
+        logp_all = F.log_softmax(prob, dim=-1)
+        logp_old_all = F.log_softmax(prob_old, dim=-1)
+        index = a.unsqueeze(-1) if a.dim() == 1 else a
+        logp = logp_all.gather(dim=-1, index=index).squeeze(-1)
+        if logp_old is None:
+            logp_old = logp_old_all.gather(dim=-1, index=index).squeeze(-1)
+        entropy = -(logp_all.exp() * logp_all).sum(dim=-1)
+        kl = (logp_old_all.exp() * (logp_old_all - logp_all)).sum(dim=-1)
+        return DistributionStats(logp, logp_old, entropy, kl)
+
+    def sample(self, prob, noise=None, generator=None):
+        if noise is None:
+            return F.softmax(prob, dim=-1).multinomial(1, generator=generator)
+        # Gumbel-max trick
+        return torch.add(prob, noise.gumbel(prob.shape, prob.device)).argmax(dim=-1, keepdim=True)
+
+    def export_params(self):
+        return dict(type='categorical', n=self.n)
 
     def to_inputs(self, action):
         with torch.no_grad():
@@ -130,7 +251,111 @@ class CategoricalPd(ProbabilityDistribution):
         return onehot
 
 
+class MultiCategoricalPd(ProbabilityDistribution):
+    # logit of padding actions, finite to avoid nan in entropy and kl
+    padding_logit = -1e9
+
+    def __init__(self, sizes):
+        """
+        Independent categorical distributions, i.e. `gym.spaces.MultiDiscrete`.
+        Logits of all dimensions are concatenated to one vector. For computations they are
+        rearranged to (*batch, num_dims, max_size) tensor with padding for smaller dimensions.
+        Args:
+            sizes: Number of actions in each dimension
+        """
+        self.sizes = [int(n) for n in sizes]
+        self.num_dims = len(self.sizes)
+        self.max_size = max(self.sizes)
+        offsets = np.cumsum([0] + self.sizes[:-1])
+        positions = np.arange(self.max_size)
+        padding_mask = positions >= np.array(self.sizes)[:, None]
+        if padding_mask.any():
+            padding = torch.from_numpy(np.where(padding_mask, 0, offsets[:, None] + positions)), \
+                      torch.from_numpy(padding_mask)
+            # (index, mask) copies for each device, so train and eval devices don't replace each other's
+            self._padding = {padding[0].device: padding}
+        else:
+            self._padding = None
+        self._input_offsets = torch.from_numpy(offsets)
+        self._input_bias = torch.cat([torch.full((n,), -1 / n) for n in self.sizes])
+
+    @property
+    def prob_vector_len(self):
+        return sum(self.sizes)
+
+    @property
+    def action_vector_len(self):
+        return self.num_dims
+
+    @property
+    def input_vector_len(self):
+        return sum(self.sizes)
+
+    @property
+    def dtype(self):
+        return torch.int64
+
+    def logp(self, a, prob):
+        return self._gather_logp(a, self._log_softmax(prob))
+
+    def kl(self, prob0, prob1):
+        logp0, logp1 = self._log_softmax(prob0), self._log_softmax(prob1)
+        return (logp0.exp() * (logp0 - logp1)).sum(dim=(-2, -1))
+
+    def entropy(self, prob):
+        logp = self._log_softmax(prob)
+        return -(logp.exp() * logp).sum(dim=(-2, -1))
+
+    def stats(self, a, prob, prob_old, logp_old=None):
+        logp_all, logp_old_all = self._log_softmax(prob), self._log_softmax(prob_old)
+        logp = self._gather_logp(a, logp_all)
+        if logp_old is None:
+            logp_old = self._gather_logp(a, logp_old_all)
+        entropy = -(logp_all.exp() * logp_all).sum(dim=(-2, -1))
+        kl = (logp_old_all.exp() * (logp_old_all - logp_all)).sum(dim=(-2, -1))
+        return DistributionStats(logp, logp_old, entropy, kl)
+
+    def sample(self, prob, noise=None, generator=None):
+        # Gumbel-max trick for all dimensions at once
+        logits = self._segments(prob)
+        if noise is None:
+            gumbel = _gumbel_noise(logits.shape, logits.device, generator)
+        else:
+            gumbel = noise.gumbel(logits.shape, logits.device)
+        return torch.add(logits, gumbel).argmax(dim=-1)
+
+    def export_params(self):
+        return dict(type='multi_categorical', sizes=self.sizes)
+
+    def to_inputs(self, action):
+        with torch.no_grad():
+            onehot = self._input_bias.to(action.device).repeat(*action.shape[:-1], 1)
+            onehot.scatter_add_(dim=-1, index=action + self._input_offsets.to(action.device),
+                                src=torch.ones(action.shape, device=action.device))
+        return onehot
+
+    def _segments(self, prob):
+        """Returns: `prob` as (*batch, num_dims, max_size) tensor"""
+        if self._padding is None:
+            return prob.view(*prob.shape[:-1], self.num_dims, self.max_size)
+        padding = self._padding.get(prob.device)
+        if padding is None:
+            index, mask = next(iter(self._padding.values()))
+            padding = self._padding[prob.device] = index.to(prob.device), mask.to(prob.device)
+        index, mask = padding
+        return prob[..., index].masked_fill(mask, self.padding_logit)
+
+    def _log_softmax(self, prob):
+        return F.log_softmax(self._segments(prob), dim=-1)
+
+    def _gather_logp(self, a, logp):
+        return logp.gather(dim=-1, index=a.unsqueeze(-1)).squeeze(-1).sum(-1)
+
+
 class BernoulliPd(ProbabilityDistribution):
+    # smaller samples are faster with `torch.bernoulli` than with buffered logistic noise
+    min_noise_buffer_numel = 1024
+
     def __init__(self, n):
         self.n = n
 
@@ -165,9 +390,26 @@ class BernoulliPd(ProbabilityDistribution):
         ent = F.binary_cross_entropy_with_logits(logits, probs, reduce=False).sum(-1)
         return ent
 
-    def sample(self, prob):
+    def stats(self, a, logits, logits_old, logp_old=None):
+        # log(sigmoid(x)) = x - softplus(x), log(1 - sigmoid(x)) = -softplus(x)
+        softplus, softplus_old = F.softplus(logits), F.softplus(logits_old)
+        probs_old = logits_old.sigmoid()
+        logp = (a * logits - softplus).sum(-1)
+        if logp_old is None:
+            logp_old = (a * logits_old - softplus_old).sum(-1)
+        entropy = (softplus - logits.sigmoid() * logits).sum(-1)
+        kl = (probs_old * (logits_old - logits) + softplus - softplus_old).sum(-1)
+        return DistributionStats(logp, logp_old, entropy, kl)
+
+    def sample(self, prob, noise=None, generator=None):
         with torch.no_grad():
-            return prob.sigmoid().bernoulli()
+            if noise is None or prob.numel() < self.min_noise_buffer_numel:
+                return prob.sigmoid().bernoulli(generator=generator)
+            # logistic noise is symmetric, so (logits - noise > 0) is also a valid sample
+            return (prob > noise.logistic(prob.shape, prob.device)).float()
+
+    def export_params(self):
+        return dict(type='bernoulli', n=self.n)
 
     @property
     def mean_div(self):
@@ -223,6 +465,11 @@ class DiagGaussianPd(ProbabilityDistribution):
         # # ent[ent > 0] = 0
         # return ent.mean(-1)
 
+    def stats(self, x, prob, prob_old, logp_old=None):
+        mean, logstd = prob.split(self.d, -1)
+        mean_old, logstd_old = prob_old.split(self.d, -1)
+        return _gaussian_stats(x, mean, logstd, mean_old, logstd_old, logp_old)
+
     def sample_with_random(self, prob, rand):
         assert rand is None or torch.is_tensor(rand)
         mean = prob[..., :self.d]
@@ -234,6 +481,21 @@ class DiagGaussianPd(ProbabilityDistribution):
         # sample = sample / sample.pow(2).mean(-1, keepdim=True).add(1e-6).sqrt()
         return sample, rand
 
+    def sample(self, prob, noise=None, generator=None):
+        rand = torch.randn(prob.shape[:-1] + (self.d,), device=prob.device, generator=generator)
+        return self.sample_with_random(prob, rand)[0]
+
+    def sample_with_logp(self, prob, noise=None, generator=None):
+        # (x - mean) / std is already known, no need to recompute it in `logp`
+        mean, logstd = prob.split(self.d, -1)
+        rand = torch.randn(mean.shape, device=mean.device, generator=generator)
+        sample = mean + logstd.exp() * rand
+        nll = 0.5 * rand.pow(2) + 0.5 * math.log(2.0 * math.pi) * self.d + logstd
+        return sample, -nll.mean(-1)
+
+    def export_params(self):
+        return dict(type='diag_gaussian', d=self.d)
+
     @property
     def mean_div(self):
         return self.d
@@ -285,9 +547,12 @@ class FixedStdGaussianPd(ProbabilityDistribution):
         # ent = 0.5 * (math.log(2 * math.pi * math.e) + logvar)
         return prob.new_zeros(prob.shape[:-1])
 
-    def sample(self, prob):
+    def sample(self, prob, noise=None, generator=None):
         mean = prob[..., :self.d]
-        return torch.normal(mean, self.std)
+        return torch.normal(mean, self.std, generator=generator)
+
+    def export_params(self):
+        return dict(type='fixed_std_gaussian', d=self.d, std=self.std)
 
     @property
     def mean_div(self):
@@ -347,6 +612,16 @@ class MultivecGaussianPd(ProbabilityDistribution):
         ent = logvar #- var
         return ent.mean(-1)
 
+    def stats(self, x, prob, prob_old, logp_old=None):
+        var, mean = self._var_mean(prob)
+        var_old, mean_old = self._var_mean(prob_old)
+        return _gaussian_stats(x, mean, 0.5 * var.log(), mean_old, 0.5 * var_old.log(), logp_old)
+
+    def _var_mean(self, prob):
+        vecs = prob.contiguous().view(*prob.shape[:-1], self.d, self.num_vec)
+        var, mean = torch.var_mean(vecs, -1)
+        return var.add(self.eps), mean
+
     def sample_with_random(self, prob, rand):
         assert rand is None or torch.is_tensor(rand)
         vecs = prob.contiguous().view(-1, self.d, self.num_vec)
@@ -360,11 +635,32 @@ class MultivecGaussianPd(ProbabilityDistribution):
         sample, rand = sample.view(*prob.shape[:-1], self.d), rand.view(prob.shape[:-1])
         return sample, rand
 
+    def sample(self, prob, noise=None, generator=None):
+        rand = torch.randint(self.num_vec, size=(prob.shape[:-1].numel(),), generator=generator)
+        return self.sample_with_random(prob, rand)[0]
+
+    def export_params(self):
+        return dict(type='multivec_gaussian', d=self.d, num_vec=self.num_vec)
+
     @property
     def init_column_norm(self):
         return math.sqrt(self.d)
 
 
+def _gaussian_stats(x, mean, logstd, mean_old, logstd_old, logp_old=None):
+    """`DistributionStats` of diagonal gaussian, same formulas as in `DiagGaussianPd`"""
+    d = mean.shape[-1]
+    inv_var = torch.exp(-2 * logstd)
+    nll = 0.5 * (x - mean).pow(2) * inv_var + 0.5 * math.log(2.0 * math.pi) * d + logstd
+    if logp_old is None:
+        nll_old = 0.5 * ((x - mean_old) * torch.exp(-logstd_old)).pow(2) + \
+                  0.5 * math.log(2.0 * math.pi) * d + logstd_old
+        logp_old = -nll_old.mean(-1)
+    entropy = 2 * logstd
+    kl = logstd - logstd_old + (torch.exp(2 * logstd_old) + (mean_old - mean).pow(2)) * 0.5 * inv_var - 0.5
+    return DistributionStats(-nll.mean(-1), logp_old, entropy.mean(-1), kl.mean(-1))
+
+
 # class DiagGaussianMixturePd(ProbabilityDistribution):
 #     def __init__(self, d, num_mixtures=4, eps=1e-6):
 #         self.d = d
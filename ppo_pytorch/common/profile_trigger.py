@@ -0,0 +1,123 @@
+import os
+import signal
+import threading
+import time
+import weakref
+
+import torch
+
+_triggers = weakref.WeakSet()
+# signal number -> handler replaced by `_handle_signal`, which is still called after it
+_previous_handlers = {}
+
+
+class ProfileTrigger:
+    def __init__(self, trace_path, timer=None, steps=None, updates=2,
+                 trigger_file='profile', signal_num=None, poll_interval=1.0):
+        """
+        Captures `torch.profiler` trace of running training on demand, without restarting it.
+            Capture starts after `signal_num` is received or `trigger_file` is created
+            and stops after `steps` env steps or `updates` training updates, whichever comes first.
+            Trace is written as `trace_{frame}.json` to `trace_path` and can be opened in chrome://tracing.
+        Args:
+            trace_path: Output directory.
+            timer: `PhaseTimer` which spans are added to trace as `record_function` ranges.
+            steps: Number of captured env steps. None disables limit.
+            updates: Number of captured training updates. None disables limit.
+            trigger_file: File name in `trace_path`, deleted when capture starts. None disables polling.
+            signal_num: Signal which starts capture, for example `signal.SIGUSR1`. Its previous Python handler
+                is still called. None disables signal handling.
+            poll_interval: Minimum interval in seconds between `trigger_file` existence checks.
+        """
+        assert steps is not None or updates is not None
+        self.trace_path = trace_path
+        self.timer = timer
+        self.steps = steps
+        self.updates = updates
+        self.trigger_file = os.path.join(trace_path, trigger_file) if trigger_file is not None else None
+        self.poll_interval = poll_interval
+        self.signal_num = signal_num
+        self.requested = False
+        self._profiler = None
+        self._frame = 0
+        self._step_count = 0
+        self._update_count = 0
+        self._last_poll_time = time.time()
+        if signal_num is not None:
+            _install_signal_handler(signal_num)
+            _triggers.add(self)
+
+    @property
+    def active(self):
+        """Is trace being captured"""
+        return self._profiler is not None
+
+    def step(self, frame):
+        """Called after each env step"""
+        self._frame = frame
+        if self._profiler is not None:
+            self._step_count += 1
+            if self.steps is not None and self._step_count >= self.steps:
+                self.stop()
+        elif self._check_requested():
+            self.start()
+
+    def update(self):
+        """Called after each training update"""
+        if self._profiler is not None:
+            self._update_count += 1
+            if self.updates is not None and self._update_count >= self.updates:
+                self.stop()
+
+    def start(self):
+        """Start capture"""
+        if self._profiler is not None:
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.requested = False
+        self._step_count = self._update_count = 0
+        self._profiler = torch.profiler.profile(activities=activities, profile_memory=True, record_shapes=True)
+        self._profiler.__enter__()
+        if self.timer is not None:
+            self.timer.annotate = True
+
+    def stop(self):
+        """Stop capture and write trace. Returns: Trace file path or None if capture isn't running."""
+        if self._profiler is None:
+            return None
+        if self.timer is not None:
+            self.timer.annotate = False
+        profiler, self._profiler = self._profiler, None
+        profiler.__exit__(None, None, None)
+        path = os.path.join(self.trace_path, f'trace_{self._frame}.json')
+        profiler.export_chrome_trace(path)
+        return path
+
+    def _check_requested(self):
+        if self.requested:
+            return True
+        if self.trigger_file is not None and self._last_poll_time + self.poll_interval < time.time():
+            self._last_poll_time = time.time()
+            if os.path.exists(self.trigger_file):
+                os.remove(self.trigger_file)
+                return True
+        return False
+
+
+def _install_signal_handler(signal_num):
+    # handlers can only be set from main thread
+    if signal_num in _previous_handlers or threading.current_thread() is not threading.main_thread():
+        return
+    _previous_handlers[signal_num] = signal.signal(signal_num, _handle_signal)
+
+
+def _handle_signal(signal_num, frame):
+    for trigger in _triggers:
+        if trigger.signal_num == signal_num:
+            trigger.requested = True
+    # signal could also be used by launcher or scheduler
+    previous = _previous_handlers.get(signal_num)
+    if callable(previous):
+        previous(signal_num, frame)
@@ -12,6 +12,87 @@ def drelu(x, dim=1):
     return a.clamp(min=0) - b.clamp(min=0)
 
 
+def _linear_scan(a, b, reverse=False):
+    """
+    Computes h_t = a_t * h_{t-1} + b_t with h_{-1} = 0 along first dimension.
+    If `reverse`, computes h_t = a_t * h_{t+1} + b_t instead.
+    Result is written to `b`. Autograd is not supported.
+    """
+    seq_len = len(b)
+    # Splitting sequence into chunks which are scanned in parallel does more work in fewer and larger ops.
+    # It is faster only when single timestep is small.
+    chunk_size = 16 if b[0].numel() <= 8192 and seq_len >= 64 else seq_len
+    if chunk_size == seq_len:
+        steps = range(seq_len - 2, -1, -1) if reverse else range(1, seq_len)
+        offset = 1 if reverse else -1
+        for t in steps:
+            b[t].addcmul_(a[t], b[t + offset])
+        return b
+    if reverse:
+        return _linear_scan(a.flip(0), b.flip(0)).flip(0)
+
+    pad = -seq_len % chunk_size
+    if pad != 0:
+        a = torch.cat([a, a.new_ones(pad, *a.shape[1:])], 0)
+        b = torch.cat([b, b.new_zeros(pad, *b.shape[1:])], 0)
+    num_chunks = len(b) // chunk_size
+    # (chunk_size, num_chunks, ...)
+    a = a.view(num_chunks, chunk_size, *a.shape[1:]).transpose(0, 1)
+    h = b.view(num_chunks, chunk_size, *b.shape[1:]).transpose(0, 1)
+    for t in range(1, chunk_size):
+        h[t].addcmul_(a[t], h[t - 1])
+    # carry last state of previous chunk
+    a_prod = a.cumprod(0)
+    for k in range(1, num_chunks):
+        h[:, k].addcmul_(a_prod[:, k], h[-1, k - 1].unsqueeze(0))
+    return b[:seq_len]
+
+
+class CPUForgetMultFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, f, x, hidden_init=None):
+        a = 1 - f
+        b = f * x
+        if hidden_init is not None:
+            b[0].addcmul_(a[0], hidden_init.view_as(b[0]))
+        h = _linear_scan(a, b)
+        ctx.save_for_backward(f, x, hidden_init, h)
+        return h
+
+    @staticmethod
+    def backward(ctx, grad_h):
+        f, x, hidden_init, h = ctx.saved_tensors
+        a = 1 - f
+        # dL/dh_t = grad_h_t + a_{t+1} * dL/dh_{t+1}
+        a_next = torch.cat([a[1:], a[:1]], 0)
+        grad = _linear_scan(a_next, grad_h.clone(), reverse=True)
+        # x_t - h_{t-1}
+        x_diff = x.clone()
+        x_diff[1:] -= h[:-1]
+        if hidden_init is not None:
+            x_diff[0] -= hidden_init.view_as(x_diff[0])
+        grad_f = grad * x_diff
+        grad_x = grad * f
+        grad_hidden = (grad[0] * a[0]).view_as(hidden_init) if hidden_init is not None else None
+        return grad_f, grad_x, grad_hidden
+
+
+def cpu_forget_mult(f, x, hidden_init=None):
+    """
+    Replacement for `ForgetMult` CPU loop. Computes h_t = f_t * x_t + (1 - f_t) * h_{t-1}.
+    Gates are computed for whole sequence at once, recurrence is one fused op per timestep
+        (or per chunk of timesteps for small batches). Gradient is computed with reverse recurrence
+        instead of autograd graph with node per timestep.
+    Args:
+        f: Forget gates (seq_len, batch, hidden_size)
+        x: Candidate values (seq_len, batch, hidden_size)
+        hidden_init: Optional initial state (batch, hidden_size)
+
+    Returns: Hidden states (seq_len, batch, hidden_size)
+    """
+    return CPUForgetMultFunction.apply(f, x, hidden_init)
+
+
 class QRNNLayer(nn.Module):
     r"""Applies a single layer Quasi-Recurrent Neural Network (QRNN) to an input sequence.
 
@@ -22,7 +103,7 @@ class QRNNLayer(nn.Module):
         window: Defines the size of the convolutional window (how many previous tokens to look when computing the QRNN values). Supports 1 and 2. Default: 1.
         zoneout: Whether to apply zoneout (i.e. failing to update elements in the hidden state) to the hidden state updates. Default: 0.
         output_gate: If True, performs QRNN-fo (applying an output gate to the output). If False, performs QRNN-f. Default: True.
-        use_cuda: If True, uses fast custom CUDA kernel. If False, uses naive for loop. Default: True.
+        use_cuda: If True, uses fast custom CUDA kernel. If False or on CPU, uses `cpu_forget_mult`. Default: True.
 
     Inputs: X, hidden
         - X (seq_len, batch, input_size): tensor containing the features of the input sequence.
@@ -118,7 +199,10 @@ class QRNNLayer(nn.Module):
 
         # Forget Mult
         # For testing QRNN without ForgetMult CUDA kernel, C = Z * F may be useful
-        C = ForgetMult()(F, Z, hidden, use_cuda=self.use_cuda and F.is_cuda)
+        if self.use_cuda and F.is_cuda:
+            C = ForgetMult()(F, Z, hidden, use_cuda=True)
+        else:
+            C = cpu_forget_mult(F, Z, hidden)
 
         # Apply (potentially optional) output gate
         if self.output_gate:
@@ -134,6 +218,49 @@ class QRNNLayer(nn.Module):
 
         return H, C[-1:, :, :]
 
+    def step(self, x, hidden=None, reset_flags=None):
+        """
+        Single timestep version of `forward`. Gives same results as `forward` with sequence of length one.
+        Args:
+            x: (batch, input_size)
+            hidden: (batch, hidden_size)
+            reset_flags: (batch)
+
+        Returns: output (batch, hidden_size) and next hidden state (batch, hidden_size)
+        """
+        if self.window == 2:
+            x = torch.cat([x, self.prevX[0] if self.prevX is not None else x * 0], 1)
+
+        Y = self.linear(x)
+        if self.norm is not None:
+            Y = self.norm(Y)
+        if self.output_gate:
+            Z, Y = Y.chunk(2, dim=1)
+            F, O = Y.chunk(2, dim=1)
+        else:
+            Z, F = Y[..., :self.hidden_size * 2], Y[..., self.hidden_size * 2:]
+        Z = drelu(Z, dim=1)
+        F = F.sigmoid()
+
+        if self.zoneout:
+            if self.training:
+                F = F * F.new(*F.size()).bernoulli_(1 - self.zoneout)
+            else:
+                F *= 1 - self.zoneout
+
+        if reset_flags is not None:
+            F = 1 - (1 - F) * (1 - reset_flags.unsqueeze(-1))
+
+        C = F * Z
+        if hidden is not None:
+            C.addcmul_(1 - F, hidden)
+        H = O.sigmoid() * C if self.output_gate else C
+
+        if self.window > 1 and self.save_prev_x:
+            self.prevX = x[:, :self.input_size].detach().unsqueeze(0)
+
+        return H, C
+
 
 class QRNN(torch.nn.Module):
     r"""Applies a multiple layer Quasi-Recurrent Neural Network (QRNN) to an input sequence.
@@ -195,6 +322,27 @@ class QRNN(torch.nn.Module):
 
         return input, next_hidden
 
+    def step(self, input, hidden=None, reset_flags=None):
+        """
+        Single timestep version of `forward`.
+        Args:
+            input: (batch, input_size)
+            hidden: (layers, batch, hidden_size)
+            reset_flags: (batch)
+
+        Returns: output (batch, hidden_size) and next hidden state (layers, batch, hidden_size)
+        """
+        next_hidden = []
+
+        for i, layer in enumerate(self.layers):
+            input, hn = layer.step(input, None if hidden is None else hidden[i], reset_flags)
+            next_hidden.append(hn)
+
+            if self.dropout != 0 and i < len(self.layers) - 1:
+                input = torch.nn.functional.dropout(input, p=self.dropout, training=self.training, inplace=False)
+
+        return input, torch.stack(next_hidden, 0)
+
 
 class DenseQRNN(torch.nn.Module):
     def __init__(self, input_size, hidden_size,
@@ -219,6 +367,7 @@ class DenseQRNN(torch.nn.Module):
         self.dropout = dropout
         self.bidirectional = bidirectional
         self.dense_output = dense_output
+        self._step_buffer = None
 
     def reset(self):
         r'''If your convolutional window is greater than 1, you must reset at the beginning of each new sequence'''
@@ -237,4 +386,50 @@ class DenseQRNN(torch.nn.Module):
 
         next_hidden = torch.cat(next_hidden, 0).view(self.num_layers, *next_hidden[0].size()[-2:])
 
-        return input if self.dense_output else new_input, next_hidden
\ No newline at end of file
+        return input if self.dense_output else new_input, next_hidden
+
+    def step(self, input, hidden=None, reset_flags=None):
+        """
+        Single timestep version of `forward`. Outputs of layers are written to single preallocated buffer
+            instead of concatenating them after each layer. Buffer is reused between calls, so it's used only
+            when autograd and dropout are disabled.
+        Args:
+            input: (batch, input_size)
+            hidden: (layers, batch, hidden_size)
+            reset_flags: (batch)
+
+        Returns: output (batch, hidden_size or dense features size) and next hidden state (layers, batch, hidden_size)
+        """
+        if torch.is_grad_enabled() or (self.dropout != 0 and self.training):
+            return self._step_concat(input, hidden, reset_flags)
+
+        in_size = input.shape[1]
+        out_size = in_size + self.num_layers * self.hidden_size
+        buffer = self._step_buffer
+        if buffer is None or buffer.shape != (input.shape[0], out_size) or \
+                buffer.device != input.device or buffer.dtype != input.dtype:
+            buffer = self._step_buffer = input.new_empty(input.shape[0], out_size)
+        buffer[:, :in_size] = input
+
+        next_hidden = []
+        for i, layer in enumerate(self.layers):
+            start = in_size + i * self.hidden_size
+            new_input, hn = layer.step(buffer[:, :start], None if hidden is None else hidden[i], reset_flags)
+            buffer[:, start:start + self.hidden_size] = new_input
+            next_hidden.append(hn)
+
+        return buffer.clone() if self.dense_output else new_input, torch.stack(next_hidden, 0)
+
+    def _step_concat(self, input, hidden, reset_flags):
+        # in-place writes to shared buffer would invalidate tensors saved for backward
+        next_hidden = []
+
+        for i, layer in enumerate(self.layers):
+            new_input, hn = layer.step(input, None if hidden is None else hidden[i], reset_flags)
+            input = torch.cat([input, new_input], 1)
+            next_hidden.append(hn)
+
+            if self.dropout != 0 and i < len(self.layers) - 1:
+                input = torch.nn.functional.dropout(input, p=self.dropout, training=self.training, inplace=False)
+
+        return input if self.dense_output else new_input, torch.stack(next_hidden, 0)
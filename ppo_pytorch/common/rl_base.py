@@ -3,7 +3,10 @@ from enum import Enum
 
 import gym
 import numpy as np
-from gym.spaces import Discrete
+from gym.spaces import Discrete, MultiDiscrete, Tuple
+
+from .memory_tracker import MemoryTracker
+from .phase_timer import PhaseTimer
 
 
 class RLStep(Enum):
@@ -15,13 +18,18 @@ class RLStep(Enum):
 
 class RLBase:
     def __init__(self, observation_space: gym.Space, action_space: gym.Space,
-                 num_actors=1, log_time_interval: float=None):
+                 num_actors=1, log_time_interval: float=None, phase_timing=False,
+                 memory_tracking=False, memory_budget=None):
         """
         Base class for all reinforcement learning algorithms. Supports running parallely on multiple envs.
         Args:
             observation_space: Env observation space.
             action_space: Env action space.
             log_time_interval: Logging interval in seconds. None disables logging.
+            phase_timing: Measure time of training loop phases and log it with throughput every log interval.
+            memory_tracking: Log peak memory usage of training loop phases and sizes of buffers.
+            memory_budget: RSS limit in bytes, warning is issued when it is about to be exceeded.
+                Enables `memory_tracking`.
         """
         self.observation_space = observation_space
         self.action_space = action_space
@@ -33,6 +41,11 @@ class RLBase:
         self._last_log_time = 0
         self._do_log = False
         self.step = 0
+        self.timer = PhaseTimer(enabled=phase_timing)
+        self.memory_tracker = MemoryTracker(enabled=memory_tracking or memory_budget is not None,
+                                            budget=memory_budget)
+        # `ProfileTrigger` set by `GymWrapper`, notified after each training update
+        self.profile_trigger = None
 
     @property
     def frame(self):
@@ -73,11 +86,13 @@ class RLBase:
             input: List of observations across all `envs`
             envs: List of parallely running envs.
 
-        Returns: Taken actions.
+        Returns: Taken actions. For `Tuple` action space, list of per-actor tuples of subspace actions.
         """
         self.prev_states = self.cur_states
         self.cur_states = self._check_states(input)
-        actions = self._step(self.prev_states, self.rewards, self.dones, self.cur_states)
+        with self.timer.span('eval'):
+            actions = self._step(self.prev_states, self.rewards, self.dones, self.cur_states)
+        self.timer.add_count('frames', self.num_actors)
         self.step += 1
         if actions is None:
             return None
@@ -85,6 +100,8 @@ class RLBase:
             actions = np.reshape(actions, (self.num_actors,))
         else:
             actions = np.reshape(actions, (self.num_actors, -1))
+            if isinstance(self.action_space, Tuple):
+                actions = [_split_tuple_action(self.action_space, a)[0] for a in actions]
         return actions
 
     def reward(self, reward: np.ndarray or list) -> None:
@@ -107,6 +124,16 @@ class RLBase:
         """Called when logger is set or changed"""
         pass
 
+    def _log_phase_times(self):
+        """Log phase times and throughput measured since last call"""
+        for name, value in self.timer.report().items():
+            self.logger.add_scalar(name, value, self.frame)
+
+    def _log_memory_usage(self):
+        """Log memory usage recorded since last call"""
+        for name, value in self.memory_tracker.report().items():
+            self.logger.add_scalar(name, value, self.frame)
+
     def _check_states(self, input) -> np.ndarray:
         """
         Check if observations have correct shape and type and convert them to numpy array.
@@ -159,4 +186,22 @@ class RLBase:
             self._last_log_time = time.time()
             self._do_log = True
         else:
-            self._do_log = False
\ No newline at end of file
+            self._do_log = False
+
+
+def _split_tuple_action(space, flat_action):
+    """
+    Convert flat action vector of `MultiCategoricalPd` to action of `Tuple` space.
+    Returns: (action of `space`, rest of `flat_action`)
+    """
+    if isinstance(space, Discrete):
+        return int(flat_action[0]), flat_action[1:]
+    if isinstance(space, MultiDiscrete):
+        n = len(space.nvec)
+        return flat_action[:n], flat_action[n:]
+    assert isinstance(space, Tuple), space
+    actions = []
+    for subspace in space.spaces:
+        action, flat_action = _split_tuple_action(subspace, flat_action)
+        actions.append(action)
+    return tuple(actions), flat_action
@@ -5,6 +5,7 @@ https://github.com/openai/retro-baselines/blob/master/agents/sonic_util.py
 import gzip
 import os
 import random
+from collections import OrderedDict
 
 import gym
 import numpy as np
@@ -76,19 +77,91 @@ class AllowBacktracking(gym.Wrapper):
         return obs, rew, done, info
 
 
+class SavestateCache:
+    """
+    Per-process cache of decompressed gym-retro savestates keyed by (game, state).
+    Optionally limited by memory, in which case least recently used states are evicted.
+    """
+    def __init__(self, max_bytes=None):
+        """
+        Args:
+            max_bytes: Maximum total size of cached savestates. None for unlimited.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._states = OrderedDict()
+
+    def get(self, game, state):
+        """Return decompressed savestate, reading it from disk on cache miss."""
+        key = game, state
+        data = self._states.get(key)
+        if data is not None:
+            self._states.move_to_end(key)
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = self._read(game, state)
+        self._insert(key, data)
+        return data
+
+    def preload(self, game, states):
+        """Load savestates into cache without changing hit / miss counters."""
+        for state in states:
+            key = game, state
+            if key not in self._states:
+                self._insert(key, self._read(game, state))
+
+    def clear(self):
+        self._states.clear()
+        self.num_bytes = 0
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self._states), bytes=self.num_bytes)
+
+    def _insert(self, key, data):
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        self._states[key] = data
+        self.num_bytes += len(data)
+        while self.max_bytes is not None and self.num_bytes > self.max_bytes:
+            _, evicted = self._states.popitem(last=False)
+            self.num_bytes -= len(evicted)
+
+    @staticmethod
+    def _read(game, state):
+        if not state.endswith('.state'):
+            state += '.state'
+        with gzip.open(os.path.join(retro.get_game_path(game), state), 'rb') as fh:
+            return fh.read()
+
+
+# shared by all `ChangeStateAtRestart` wrappers created in current process
+savestate_cache = SavestateCache()
+
+
 class ChangeStateAtRestart(gym.Wrapper):
-    def __init__(self, env, state_names):
+    def __init__(self, env, state_names, cache: SavestateCache=None, preload=True):
+        """
+        Start each episode from randomly selected savestate.
+        Args:
+            env: gym-retro env
+            state_names: Savestates to choose from
+            cache: Savestate cache. Process-wide `savestate_cache` is used by default.
+            preload: Load all `state_names` into cache at creation
+        """
         self.state_names = state_names
+        self.cache = cache if cache is not None else savestate_cache
         super().__init__(env)
+        if preload:
+            self.cache.preload(self.unwrapped.gamename, state_names)
 
     def reset(self, **kwargs):
         env: RetroEnv = self.unwrapped
         env.statename = state = random.choice(self.state_names)
-        game_path = retro.get_game_path(env.gamename)
-        if not state.endswith('.state'):
-            state += '.state'
-        with gzip.open(os.path.join(game_path, state), 'rb') as fh:
-            env.initial_state = fh.read()
+        env.initial_state = self.cache.get(env.gamename, state)
         return self.env.reset(**kwargs)
 
 
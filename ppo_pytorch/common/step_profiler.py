@@ -0,0 +1,101 @@
+import time
+
+import gym
+import numpy as np
+
+
+class StepProfiler:
+    def __init__(self, report_interval=1000):
+        """
+        Measures time spent in each layer of env wrapper stack.
+        Each layer is wrapped with `StepTimer`, outermost layer is wrapped with `StepProfileReporter`.
+        Every `report_interval` steps mean and 95th percentile of per-layer step time (excluding inner layers)
+            is added to `info['step_profile']` as dict[layer name, (mean ms, p95 ms)].
+        Args:
+            report_interval: Number of steps between reports.
+        """
+        self.report_interval = report_interval
+        self.names = []
+        self._pending = []
+        self._times = None
+        self._step = 0
+
+    def wrap(self, env, name=None):
+        """Time `env.step` including all inner layers"""
+        if name is None:
+            name = type(env).__name__ if len(self.names) != 0 else 'env'
+        if name in self.names:
+            name = f'{name} {len(self.names)}'
+        self.names.append(name)
+        self._pending.append(0.0)
+        return StepTimer(env, self, len(self.names) - 1)
+
+    def finish(self, env):
+        """Wrap outermost layer"""
+        return StepProfileReporter(env, self)
+
+    def add_time(self, index, duration):
+        self._pending[index] += duration
+
+    def clear_pending(self):
+        self._pending = [0.0] * len(self._pending)
+
+    def end_step(self):
+        """
+        Called after outermost step.
+        Returns: Summary dict once per `report_interval` steps, None otherwise.
+        """
+        if self._times is None:
+            self._times = np.zeros((self.report_interval, len(self.names)))
+        inclusive = np.array(self._pending)
+        exclusive = self._times[self._step % self.report_interval]
+        exclusive[:] = inclusive
+        exclusive[1:] -= inclusive[:-1]
+        self.clear_pending()
+        self._step += 1
+        if self._step % self.report_interval != 0:
+            return None
+        ms = self._times * 1000
+        mean, p95 = ms.mean(0), np.percentile(ms, 95, axis=0)
+        return {name: (mean[i], p95[i]) for i, name in enumerate(self.names)}
+
+
+class StepTimer(gym.Wrapper):
+    def __init__(self, env, profiler: StepProfiler, index):
+        super().__init__(env)
+        self._profiler = profiler
+        self._index = index
+
+    def step(self, action):
+        start_time = time.perf_counter()
+        res = self.env.step(action)
+        self._profiler.add_time(self._index, time.perf_counter() - start_time)
+        return res
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
+
+    def _warn_double_wrap(self):
+        pass
+
+
+class StepProfileReporter(gym.Wrapper):
+    def __init__(self, env, profiler: StepProfiler):
+        super().__init__(env)
+        self._profiler = profiler
+
+    def step(self, action):
+        state, reward, done, info = self.env.step(action)
+        summary = self._profiler.end_step()
+        if summary is not None:
+            info['step_profile'] = summary
+        return state, reward, done, info
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        # steps done during reset are not counted
+        self._profiler.clear_pending()
+        return obs
+
+    def _warn_double_wrap(self):
+        pass
@@ -1,11 +1,16 @@
+import atexit
 import os
-import time
-from collections import deque, namedtuple
+import queue
 import tempfile
+import threading
+import time
+import traceback
 
 import numpy as np
+import torch
 
-Reward = namedtuple('Reward', 'reward, len, episode, frame')
+from .episode_stats import EpisodeRecorder, EpisodeStats
+from .histogram_summary import histogram_summary
 
 
 class TensorboardEnvLogger:
@@ -16,7 +21,10 @@ class TensorboardEnvLogger:
                  env_count,
                  log_time_interval=5,
                  reward_std_episodes=100,
-                 tag='',):
+                 tag='',
+                 async_queue_size=256,
+                 histogram_bins=64,
+                 histogram_max_elements=1 << 16):
         """
         Tensorboard logger. Does logging of environment episode information
             and wrapping logger calls for classes inherited from `RLBase`.
@@ -27,6 +35,13 @@ class TensorboardEnvLogger:
             env_count: Number of parallely running envs.
             log_time_interval: Logging interval in seconds.
             reward_std_episodes: Reward statistics calculation window.
+                Episode records are written to `episodes` directory of run, see `read_episodes`.
+            async_queue_size: Max number of pending `add_*` calls written by background thread.
+                Calls are dropped when queue is full. If None, calls are written synchronously.
+            histogram_bins: Number of bins of histograms precomputed by `histogram_summary`.
+                If None, full tensors are passed to tensorboardX.
+            histogram_max_elements: Histogram counts of larger tensors are estimated from random subsample.
+                If None, all elements are counted.
         """
         assert log_path is not None
         from tensorboardX import SummaryWriter  # to remove dependency if not used
@@ -36,19 +51,37 @@ class TensorboardEnvLogger:
         self.env_name = env_name
         self.tag = tag
         self.env_count = env_count
-        self.reward_window = deque(maxlen=reward_std_episodes)
+        self.histogram_bins = histogram_bins
+        self.histogram_max_elements = histogram_max_elements
+        self.episode_stats = EpisodeStats(env_count, reward_std_episodes)
         self.reward_sum = np.zeros(self.env_count)
         self.episode_lens = np.zeros(self.env_count)
-        self.new_rewards = []
-        self.new_rewards_orig = []
-        self.episode = 0
+        self.new_reset_stalls = []
+        self.reset_stall_sums = np.zeros(self.env_count)
+        self.new_step_profiles = []
         self.frame = 0
         self.last_log_time = time.time()
         timestr = time.strftime('%Y-%m-%d_%H-%M-%S')
         dir_name = f'{self.alg_name}_{self.env_name}_{tag}_{timestr}_'
         path = tempfile.mkdtemp('', dir_name, self.log_path)
+        self.run_path = path
         self.logger = SummaryWriter(path)
-        self.episodes_file = open(os.path.join(path, 'episodes'), 'a')
+        self.episode_recorder = EpisodeRecorder(os.path.join(path, 'episodes'))
+        # seconds spent in `add_*` by calling threads
+        self.blocking_time = 0
+        self.dropped = 0
+        # bytes of tensor snapshots put to queue
+        self._submitted_bytes = 0
+        # seconds spent by writer thread since last log and bytes written by it, updated only under `_write_lock`
+        self._write_lock = threading.Lock()
+        self._write_time = 0
+        self._written_bytes = 0
+        self._queue = None
+        if async_queue_size is not None:
+            self._queue = queue.Queue(async_queue_size)
+            self._writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer_thread.start()
+            atexit.register(self.close)
 
     def step(self, infos: dict or list, force_log: bool):
         """
@@ -62,50 +95,146 @@ class TensorboardEnvLogger:
 
         self.frame += self.env_count
 
-        for info in infos:
+        for actor, info in enumerate(infos):
+            reset_stall = info.get('reset_stall')
+            if reset_stall is not None:
+                self.new_reset_stalls.append(reset_stall)
+                self.reset_stall_sums[actor] += reset_stall
+            step_profile = info.get('step_profile')
+            if step_profile is not None:
+                self.new_step_profiles.append(step_profile)
             ep_info = info.get('episode')
             if ep_info is not None:
-                self.reward_window.append(ep_info.reward)
-                self.new_rewards.append(Reward(ep_info.reward, ep_info.len, self.episode, self.frame))
-                self.episode += 1
-                self.episodes_file.write(f'{ep_info.reward}, {ep_info.len}\n')
+                self.episode_stats.add(actor, ep_info.reward, ep_info.len, self.frame)
+                self.episode_recorder.append(ep_info.reward, ep_info.len, actor, self.frame)
             ep_info_orig = info.get('episode_orig')
             if ep_info_orig is not None:
-                self.new_rewards_orig.append(Reward(ep_info_orig.reward, ep_info_orig.len, self.episode, self.frame))
+                self.episode_stats.add_orig(ep_info_orig.reward)
 
-        if len(self.new_rewards) != 0 and self.logger is not None and \
+        stats = self.episode_stats
+        if stats.new_episodes != 0 and self.logger is not None and \
            (time.time() > self.last_log_time + self.log_time_interval or force_log):
             self.last_log_time = time.time()
-            wrmean = np.mean(self.reward_window)
-            wrstd = np.std(self.reward_window)
-            self.logger.add_scalar('reward mean window by episode', wrmean, self.frame)
-            self.logger.add_scalar('reward std window by episode', wrstd, self.frame)
-            self.logger.add_scalar('reward norm std window by episode', wrstd / abs(wrmean), self.frame)
-            self.logger.add_scalar('episode lengths', self.new_rewards[-1].len, self.new_rewards[-1].episode)
-            self.logger.add_scalar('reward by episode', self.new_rewards[-1].reward, self.new_rewards[-1].episode)
-            self.logger.add_scalar('reward by frame', self.new_rewards[-1].reward, self.new_rewards[-1].frame)
-            avg_ep = np.mean([r.episode for r in self.new_rewards])
-            avg_frame = np.mean([r.frame for r in self.new_rewards])
-            avg_len = np.mean([r.len for r in self.new_rewards])
-            avg_r = np.mean([r.reward for r in self.new_rewards])
-            self.logger.add_scalar('avg episode lengths', avg_len, avg_ep)
-            self.logger.add_scalar('avg reward by episode', avg_r, avg_ep)
-            self.logger.add_scalar('avg reward by frame', avg_r, avg_frame)
-            if len(self.new_rewards_orig) != 0:
-                avg_r_orig = np.mean([r.reward for r in self.new_rewards_orig])
-                self.logger.add_scalar('avg reward by frame orig', avg_r_orig, avg_frame)
-                self.new_rewards_orig.clear()
-            self.new_rewards.clear()
-            self.episodes_file.flush()
+            wrmean, wrstd, percentiles = stats.window_summary()
+            self.add_scalar('reward mean window by episode', wrmean, self.frame)
+            self.add_scalar('reward std window by episode', wrstd, self.frame)
+            self.add_scalar('reward norm std window by episode', wrstd / abs(wrmean), self.frame)
+            for q, value in zip(stats.quantiles, percentiles):
+                self.add_scalar(f'reward p{q} window by episode', value, self.frame)
+            last_r, last_len, last_ep, last_frame = stats.last
+            self.add_scalar('episode lengths', last_len, last_ep)
+            self.add_scalar('reward by episode', last_r, last_ep)
+            self.add_scalar('reward by frame', last_r, last_frame)
+            avg_ep, avg_frame, avg_len, avg_r, avg_r_orig = stats.interval_summary()
+            self.add_scalar('avg episode lengths', avg_len, avg_ep)
+            self.add_scalar('avg reward by episode', avg_r, avg_ep)
+            self.add_scalar('avg reward by frame', avg_r, avg_frame)
+            if avg_r_orig is not None:
+                self.add_scalar('avg reward by frame orig', avg_r_orig, avg_frame)
+            self.add_histogram('episodes by actor', stats.episode_counts, self.frame)
+            if len(self.new_reset_stalls) != 0:
+                self.add_scalar('reset stall mean', np.mean(self.new_reset_stalls), self.frame)
+                self.add_scalar('reset stall max', np.max(self.new_reset_stalls), self.frame)
+                self.add_histogram('reset stall total by actor', self.reset_stall_sums, self.frame)
+                self.new_reset_stalls.clear()
+            if len(self.new_step_profiles) != 0:
+                for name in self.new_step_profiles[0].keys():
+                    mean, p95 = np.mean([p[name] for p in self.new_step_profiles], 0)
+                    self.add_scalar(f'step time mean ms {name}', mean, self.frame)
+                    self.add_scalar(f'step time p95 ms {name}', p95, self.frame)
+                self.new_step_profiles.clear()
+            with self._write_lock:
+                write_time, self._write_time = self._write_time, 0
+            self.add_scalar('logger blocking time ms', self.blocking_time * 1000, self.frame)
+            self.add_scalar('logger write time ms', write_time * 1000, self.frame)
+            self.add_scalar('logger dropped calls', self.dropped, self.frame)
+            self.blocking_time = 0
+            self.episode_recorder.flush()
 
     def add_scalar(self, *args, **kwargs):
-        return self.logger.add_scalar(*args, **kwargs)
+        self._submit(self.logger.add_scalar, args, kwargs)
 
-    def add_histogram(self, *args, **kwargs):
-        return self.logger.add_histogram(*args, **kwargs)
+    def add_histogram(self, tag, values, global_step=None, *args, **kwargs):
+        if self.histogram_bins is None or not (torch.is_tensor(values) or isinstance(values, np.ndarray)):
+            self._submit(self.logger.add_histogram, (tag, values, global_step, *args), kwargs)
+            return
+        start_time = time.time()
+        summary = histogram_summary(values, self.histogram_bins, self.histogram_max_elements)
+        self.blocking_time += time.time() - start_time
+        if summary is not None:
+            self._submit(self.logger.add_histogram_raw, (tag, *summary, global_step), {})
 
     def add_image(self, *args, **kwargs):
-        return self.logger.add_image(*args, **kwargs)
+        self._submit(self.logger.add_image, args, kwargs)
 
     def add_text(self, *args, **kwargs):
-        return self.logger.add_text(*args, **kwargs)
+        self._submit(self.logger.add_text, args, kwargs)
+
+    def close(self):
+        """Write pending calls and close writer"""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._writer_thread.join()
+            self._queue = None
+            atexit.unregister(self.close)
+        self.episode_recorder.close()
+        self.logger.close()
+
+    def _submit(self, fn, args, kwargs):
+        start_time = time.time()
+        if self._queue is None:
+            fn(*args, **kwargs)
+        else:
+            # tensors could be modified in-place after call, so copy them
+            args = [_snapshot(v) for v in args]
+            kwargs = {k: _snapshot(v) for k, v in kwargs.items()}
+            size = sum(_nbytes(v) for v in args) + sum(_nbytes(v) for v in kwargs.values())
+            try:
+                self._queue.put_nowait((fn, args, kwargs, size))
+                self._submitted_bytes += size
+            except queue.Full:
+                self.dropped += 1
+        self.blocking_time += time.time() - start_time
+
+    def _write_loop(self):
+        while True:
+            call = self._queue.get()
+            if call is None:
+                return
+            start_time = time.time()
+            fn, args, kwargs, size = call
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            with self._write_lock:
+                self._written_bytes += size
+                self._write_time += time.time() - start_time
+
+    @property
+    def write_time(self):
+        """Seconds spent by writer thread since last logged 'logger write time ms'"""
+        with self._write_lock:
+            return self._write_time
+
+    @property
+    def queued_bytes(self):
+        """Bytes of tensor and array snapshots waiting in queue"""
+        with self._write_lock:
+            return self._submitted_bytes - self._written_bytes
+
+
+def _snapshot(value):
+    if torch.is_tensor(value):
+        return value.detach().to('cpu', copy=True)
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+def _nbytes(value):
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
@@ -1,5 +1,6 @@
 from .actors import FCActor, Actor
 from .cnn_actors import CNNActor, Sega_CNNActor
-from .heads import ActionValuesHead, HeadBase, PolicyHead, StateValueHead
+from .heads import ActionValuesHead, HeadBase, PolicyHead, StateValueHead, ActorCriticHead
 from .qrnn_actors import QRNNActor, CNN_QRNNActor
 from .norm_factory import NormFactory, LambdaNormFactory, BatchNormFactory, GroupNormFactory, InstanceNormFactory, LayerNormFactory
+from .export import export_policy
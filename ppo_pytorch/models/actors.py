@@ -1,4 +1,5 @@
 import math
+from collections import namedtuple
 from functools import partial
 from typing import Optional, List, Callable, Dict
 
@@ -7,7 +8,7 @@ import numpy as np
 import torch.nn as nn
 import torch.nn.init as init
 
-from .heads import HeadBase, HeadOutput
+from .heads import HeadBase, HeadOutput, ActorCriticHead, ActorCriticOutput
 from .norm_factory import NormFactory
 from .utils import weights_init
 from ..common.probability_distributions import make_pd, ProbabilityDistribution
@@ -26,7 +27,8 @@ class Actor(nn.Module):
             observation_space: Observation space
             action_space: Action space
             head_factory: Function which accepts [hidden vector size, `ProbabilityDistribution`]
-                and returns dict[head name, `HeadBase`]
+                and returns dict[head name, `HeadBase`]. Heads with `output_names` attribute (like `ActorCriticHead`)
+                return tuple of several outputs with these names instead of single output named as head.
             norm: Normalization type
             weight_init: Weight initialization function
             weight_init_gain: Gain for `weight_init`
@@ -41,6 +43,7 @@ class Actor(nn.Module):
 
         self.do_log = False
         self.logger = None
+        self.use_fast_path = True
         self.hidden_code_size = None
         self._step = 0
         self.pd = make_pd(action_space)
@@ -95,14 +98,62 @@ class Actor(nn.Module):
         seq = nn.Sequential(*seq)
         return seq
 
+    def _head_outputs(self, x):
+        """Returns: List of head outputs in order of `self._output_names`"""
+        outputs = []
+        for head in self.heads.values():
+            if hasattr(head, 'output_names'):
+                outputs.extend(head(x))
+            else:
+                outputs.append(head(x))
+        return outputs
+
     def _run_heads(self, hidden_code):
-        heads = {name: head(hidden_code) for name, head in self.heads.items()}
+        heads = dict(zip(self._output_names, self._head_outputs(hidden_code)))
         return HeadOutput(hidden_code=hidden_code, **heads)
 
+    def _run_heads_fast(self, x, hidden_code):
+        """
+        Same as `_run_heads`, but returns `ActorCriticOutput` for 'probs' and 'state_value' outputs,
+            or namedtuple with output names and `hidden_code` as fields for other heads
+        """
+        return self._output_type(*self._head_outputs(x), hidden_code)
+
+    def refresh_fast_path(self):
+        """Must be called after replacing model layers, for example during quantization"""
+        pass
+
+    @property
+    def trunk(self) -> Optional[nn.Module]:
+        """
+        Feature extractor which could be frozen during training. None if actor doesn't have one.
+            Actors with trunk also implement `extract_trunk_features(input)`, which runs it,
+            and `forward_trunk_features(features)`, which is same as `forward` starting from its output.
+        """
+        return None
+
+    def _is_fast_path(self, hidden_code_input, only_hidden_code_output):
+        """Whether forward pass may skip logging and intermediate hidden code extraction"""
+        return self.use_fast_path and not self.do_log and not hidden_code_input and not only_hidden_code_output
+
     def _init_heads(self, hc_size):
         self.heads = self.head_factory(hc_size, self.pd)
         for name, head in self.heads.items():
             self.add_module("head_" + name, head)
+        self._output_names = [out_name for name, head in self.heads.items()
+                              for out_name in getattr(head, 'output_names', (name,))]
+        if self._output_names == ['probs', 'state_value']:
+            self._output_type = ActorCriticOutput
+        else:
+            self._output_type = namedtuple('ActorOutput', [*self._output_names, 'hidden_code'])
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # models saved with separate 'probs' and 'state_value' heads could be loaded to `ActorCriticHead`
+        for name, head in self.heads.items():
+            if isinstance(head, ActorCriticHead):
+                head.convert_state_dict(state_dict, f'{prefix}head_probs.', f'{prefix}head_state_value.',
+                                        f'{prefix}head_{name}.')
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
 
 class FCActor(Actor):
@@ -127,9 +178,32 @@ class FCActor(Actor):
         self.hidden_code_size = obs_len if hidden_code_type == 'input' else hidden_sizes[-1]
         self._init_heads(hidden_sizes[-1])
         self.linear = self._create_fc(obs_len, None, hidden_sizes, activation, self.norm)
+        self._fast_trunk = self._split_trunk()
         self.reset_weights()
 
+    def refresh_fast_path(self):
+        self._fast_trunk = self._split_trunk()
+
+    def _split_trunk(self):
+        """
+        Split `self.linear` into (layers before hidden code, layers after hidden code) for use in fast path.
+        Stored in tuple to avoid registering same modules twice.
+        """
+        if self.hidden_code_type == 'input':
+            return nn.Sequential(), self.linear
+        elif self.hidden_code_type == 'first':
+            first, rest = self.linear[0], list(self.linear[1:])
+            return nn.Sequential(*first[:-1]), nn.Sequential(first[-1], *rest)
+        else:
+            last, rest = self.linear[-1], list(self.linear[:-1])
+            return nn.Sequential(*rest, *last[:-1]), last[-1]
+
     def forward(self, input, hidden_code_input=False, only_hidden_code_output=False):
+        if self._is_fast_path(hidden_code_input, only_hidden_code_output):
+            pre_hidden, post_hidden = self._fast_trunk
+            hidden_code = pre_hidden(input)
+            return self._run_heads_fast(post_hidden(hidden_code), hidden_code)
+
         if hidden_code_input and only_hidden_code_output:
             return HeadOutput(hidden_code=input)
 
@@ -13,14 +13,35 @@ from ..common.make_grid import make_grid
 
 class GroupTranspose(nn.Module):
     def __init__(self, groups):
+        """
+        Channel shuffle from ShuffleNet, which spreads channels of each group over all groups of next layer.
+        Args:
+            groups: Number of groups of previous layer.
+        """
         super().__init__()
         self.groups = groups
+        # permutation of `ChannelShuffle` used by loaded old checkpoints instead of transpose
+        self.register_buffer('indices', None)
 
     def forward(self, input):
+        if self.indices is not None:
+            return input.index_select(1, self.indices.to(input.device))
+        if not input.is_contiguous() and input.is_contiguous(memory_format=torch.channels_last):
+            # (N, H, W, C)
+            x = input.permute(0, 2, 3, 1)
+            x = x.view(*x.shape[:3], self.groups, -1).transpose(3, 4).contiguous()
+            return x.view(input.shape[0], *input.shape[2:], input.shape[1]).permute(0, 3, 1, 2)
         x = input.view(input.shape[0], self.groups, -1, *input.shape[2:])
         x = x.transpose(1, 2).contiguous()
         return x.view_as(input)
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # 'grouped' `CNNActor` checkpoints saved with `ChannelShuffle` have its random permutation in 'indices',
+        # which is kept, so they load strictly and give same outputs
+        indices = state_dict.get(f'{prefix}indices')
+        self.indices = None if indices is None else indices.clone()
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
 
 class ChannelShuffle(nn.Module):
     def __init__(self, channels):
@@ -36,7 +57,8 @@ class CNNActor(Actor):
     Convolution network.
     """
     def __init__(self, observation_space, action_space, head_factory, cnn_kind='normal', *args,
-                 cnn_activation=nn.ReLU, fc_activation=nn.ReLU, cnn_hidden_code=False, hidden_code_type='input', **kwargs):
+                 cnn_activation=nn.ReLU, fc_activation=nn.ReLU, cnn_hidden_code=False, hidden_code_type='input',
+                 channels_last=False, **kwargs):
         """
         Args:
             observation_space: Env's observation space
@@ -44,14 +66,18 @@ class CNNActor(Actor):
             head_factory: Function which accept (hidden vector size, `ProbabilityDistribution`) and return `HeadBase`
             cnn_kind: Type of cnn.
                 'normal' - CNN from Nature DQN paper (Mnih et al. 2015)
-                'custom' - largest CNN of custom structure
+                'large' - larger CNN of custom structure
+                'grouped' - grouped convolutions with `GroupTranspose` between them
             cnn_activation: Activation function
+            channels_last: Run convolutions in channels last (NHWC) memory format,
+                which is faster with oneDNN (mkldnn) on CPU. Outputs are same as with default format.
         """
         super().__init__(observation_space, action_space, head_factory, *args, **kwargs)
         self.cnn_activation = cnn_activation
         self.linear_activation = fc_activation
         self.cnn_kind = cnn_kind
         self.cnn_hidden_code = cnn_hidden_code
+        self.channels_last = channels_last
 
         # create convolutional layers
         if cnn_kind == 'normal': # Nature DQN (1,683,456 parameters)
@@ -72,15 +98,17 @@ class CNNActor(Actor):
             self.linear = self._make_fc_layer(nf * 8 * 4 * 4, 512)
         elif cnn_kind == 'grouped': # custom grouped (6,950,912 parameters)
             nf = 32
+            # each `GroupTranspose` gets group count of preceding conv, first one is identity,
+            # but keeps module indices of old `ChannelShuffle` checkpoints
             self.convs = nn.ModuleList([
                 self._make_cnn_layer(observation_space.shape[0], nf * 4, 4, 2, 0, first_layer=True),
-                ChannelShuffle(nf * 4),
+                GroupTranspose(1),
                 self._make_cnn_layer(nf * 4, nf * 8, 4, 2, 0, groups=8),
-                ChannelShuffle(nf * 8),
+                GroupTranspose(8),
                 self._make_cnn_layer(nf * 8, nf * 16, 4, 2, 1, groups=16),
-                ChannelShuffle(nf * 16),
+                GroupTranspose(16),
                 self._make_cnn_layer(nf * 16, nf * 32, 4, 2, 1, groups=32),
-                ChannelShuffle(nf * 32),
+                GroupTranspose(32),
                 self._make_cnn_layer(nf * 32, nf * 8, 3, 1, 1, groups=8),
             ])
             self.linear = self._make_fc_layer(nf * 8 * 4 * 4, 512)
@@ -93,6 +121,13 @@ class CNNActor(Actor):
 
         self.reset_weights()
 
+    def reset_weights(self):
+        # weight init functions expect contiguous tensors
+        self.convs.to(memory_format=torch.contiguous_format)
+        super().reset_weights()
+        if self.channels_last:
+            self.convs.to(memory_format=torch.channels_last)
+
     def _make_fc_layer(self, in_features, out_features, first_layer=False):
         bias = self.norm is None or not self.norm.disable_bias or not self.norm.allow_fc
         return self._make_layer(nn.Linear(in_features, out_features, bias=bias), first_layer=first_layer)
@@ -116,6 +151,8 @@ class CNNActor(Actor):
 
     def _extract_features(self, x):
         #x = input - input.median() # * 2 - 1
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         for i, layer in enumerate(self.convs):
             # run conv layer
             x = layer(x)
@@ -125,7 +162,39 @@ class CNNActor(Actor):
                 # self.log_conv_filters(i, layer[0])
         return x
 
+    @property
+    def trunk(self):
+        return self.convs
+
+    def extract_trunk_features(self, input):
+        """Run `trunk` on `input`. Output is passed to `forward_trunk_features`."""
+        x = image_to_float(input)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        for layer in self.convs:
+            x = layer(x)
+        return x.reshape(x.size(0), -1)
+
+    def forward_trunk_features(self, features):
+        """Same as `forward`, but starts from `extract_trunk_features` output"""
+        if self.cnn_hidden_code:
+            hidden_code, x = features, self.linear(features)
+        else:
+            x = hidden_code = self.linear(features)
+
+        if self.use_fast_path and not self.do_log:
+            return self._run_heads_fast(x, hidden_code)
+
+        ac_out = self._run_heads(x)
+        ac_out.hidden_code = hidden_code
+        if self.do_log:
+            self.logger.add_histogram('conv linear', x, self._step)
+        return ac_out
+
     def forward(self, input, hidden_code_input=False, only_hidden_code_output=False):
+        if self._is_fast_path(hidden_code_input, only_hidden_code_output):
+            return self.forward_trunk_features(self.extract_trunk_features(input))
+
         log_policy_attention = self.do_log and input.is_leaf and not hidden_code_input and not only_hidden_code_output
         if not hidden_code_input:
             input = image_to_float(input)
@@ -134,7 +203,7 @@ class CNNActor(Actor):
 
             x = self._extract_features(input)
 
-            x = x.view(x.size(0), -1)
+            x = x.reshape(x.size(0), -1)
 
             if not self.cnn_hidden_code:
                 x = self.linear(x)
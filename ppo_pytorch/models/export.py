@@ -0,0 +1,49 @@
+import copy
+import json
+
+import torch
+import torch.nn as nn
+
+from .actors import Actor
+from .qrnn_actors import QRNNActor, CNN_QRNNActor
+
+POLICY_FORMAT_VERSION = 1
+
+
+class _TracedPolicy(nn.Module):
+    """Returns plain tensors instead of `HeadOutput`, so actor could be traced"""
+    def __init__(self, model: Actor):
+        super().__init__()
+        self.model = model
+
+    def forward(self, states):
+        ac_out = self.model(states)
+        return ac_out.probs, ac_out.state_value
+
+
+def export_policy(model: Actor, path, image_observation=False):
+    """
+    Save feed-forward actor as standalone TorchScript file which could be loaded by `policy_runtime.load_policy`
+        without `ppo_pytorch` and its dependencies. Observation format and `ProbabilityDistribution` parameters
+        needed to sample actions are stored in file as 'policy.json'.
+    Args:
+        model: Trained actor. Recurrent actors are not supported.
+        path: Output file path.
+        image_observation: Same as `PPO.image_observation`. Observations are converted to uint8 before model call.
+    """
+    if isinstance(model, (QRNNActor, CNN_QRNNActor)):
+        raise ValueError(f'recurrent actors are not supported, got {type(model).__name__}')
+    model = copy.deepcopy(model).cpu().eval()
+    model.set_log(None, False, 0)
+    obs_shape = model.observation_space.shape
+    dtype = torch.uint8 if image_observation else torch.float
+    example = torch.zeros((1, *obs_shape), dtype=dtype)
+    with torch.no_grad():
+        traced = torch.jit.trace(_TracedPolicy(model), example)
+    metadata = dict(
+        format_version=POLICY_FORMAT_VERSION,
+        observation_shape=list(obs_shape),
+        image_observation=image_observation,
+        pd=model.pd.export_params(),
+    )
+    torch.jit.save(traced, str(path), _extra_files={'policy.json': json.dumps(metadata)})
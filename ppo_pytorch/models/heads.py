@@ -1,3 +1,4 @@
+import torch
 import torch.nn as nn
 
 from .utils import normalized_columns_initializer_
@@ -15,6 +16,19 @@ class HeadOutput(dict):
         self[key] = value
 
 
+class ActorCriticOutput:
+    """
+    Output of `Actor` fast path with `ActorCriticHead` or (`PolicyHead`, `StateValueHead`) heads.
+        Unlike `HeadOutput` it is not a dict and has fixed set of fields.
+    """
+    __slots__ = ('probs', 'state_value', 'hidden_code')
+
+    def __init__(self, probs, state_value, hidden_code=None):
+        self.probs = probs
+        self.state_value = state_value
+        self.hidden_code = hidden_code
+
+
 class HeadBase(nn.Module):
     """
     Base class for output of `Actor`. Different heads used for different learning algorithms.
@@ -109,4 +123,48 @@ class StateValueHead(HeadBase):
         self.linear.bias.data.fill_(0)
 
     def forward(self, x):
-        return self.linear(x).squeeze(-1)
\ No newline at end of file
+        return self.linear(x).squeeze(-1)
+
+
+class ActorCriticHead(HeadBase):
+    """
+    Fused `PolicyHead` and `StateValueHead`. Computes both outputs with single matrix multiplication.
+    Returns (probs, state_value) tuple of `output_names`, which are both views of same output tensor.
+    """
+    output_names = ('probs', 'state_value')
+
+    def __init__(self, in_features, pd: ProbabilityDistribution):
+        """
+        Args:
+            in_features: Input feature vector width.
+            pd: Action probability distribution.
+        """
+        super().__init__(in_features)
+        self.pd = pd
+        self.linear = nn.Linear(in_features, self.pd.prob_vector_len + 1)
+        self.reset_weights()
+
+    def reset_weights(self):
+        probs_weight, value_weight = self.linear.weight.data.split([self.pd.prob_vector_len, 1], 0)
+        normalized_columns_initializer_(probs_weight, self.pd.init_column_norm)
+        normalized_columns_initializer_(value_weight, 1.0)
+        self.linear.bias.data.fill_(0)
+
+    def forward(self, x):
+        probs, state_value = self.linear(x).split([self.pd.prob_vector_len, 1], -1)
+        return probs, state_value.squeeze(-1)
+
+    def convert_state_dict(self, state_dict, policy_prefix, value_prefix, prefix):
+        """
+        Convert `PolicyHead` and `StateValueHead` parameters in `state_dict` to `ActorCriticHead` parameters.
+        Args:
+            state_dict: Model state dict. Converted in place.
+            policy_prefix: Prefix of `PolicyHead` parameters.
+            value_prefix: Prefix of `StateValueHead` parameters.
+            prefix: Prefix of this head parameters.
+        """
+        for name in ('weight', 'bias'):
+            policy_key, value_key = f'{policy_prefix}linear.{name}', f'{value_prefix}linear.{name}'
+            if policy_key in state_dict and value_key in state_dict:
+                state_dict[f'{prefix}linear.{name}'] = torch.cat(
+                    [state_dict.pop(policy_key), state_dict.pop(value_key)], 0)
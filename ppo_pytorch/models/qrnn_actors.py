@@ -12,7 +12,7 @@ from .utils import image_to_float
 
 class QRNNActor(Actor):
     def __init__(self, observation_space: gym.Space, action_space: gym.Space, *args,
-                 qrnn_hidden_size=128, qrnn_layers=3, **kwargs):
+                 qrnn_hidden_size=128, qrnn_layers=3, hidden_code_type=None, **kwargs):
         """
         Args:
             observation_space: Env's observation space
@@ -20,6 +20,7 @@ class QRNNActor(Actor):
             head_factory: Function which accept (hidden vector size, `ProbabilityDistribution`) and return `HeadBase`
             hidden_sizes: List of hidden layers sizes
             activation: Activation function
+            hidden_code_type: Ignored, hidden code is always QRNN output. Accepted for compatibility with `PPO`.
         """
         super().__init__(observation_space, action_space, *args, **kwargs)
         self.qrnn_hidden_size = self.hidden_code_size = qrnn_hidden_size
@@ -31,9 +32,23 @@ class QRNNActor(Actor):
 
     def forward(self, input, memory, done_flags):
         x, next_memory = self.qrnn(input, memory, done_flags)
-        head = self.head(x)
+        head = self._run_heads(x)
         return head, next_memory
 
+    def step(self, input, memory, done_flags):
+        """
+        Single timestep inference. Gives same results as `forward` with sequence of length one.
+        Args:
+            input: (actors, *obs_shape)
+            memory: (layers, actors, hidden_size) or None
+            done_flags: (actors)
+
+        Returns: Head outputs without sequence dim and next memory (layers, actors, hidden_size)
+        """
+        x = input.reshape(input.shape[0], -1)
+        x, next_memory = self.qrnn.step(x, memory, done_flags)
+        return self._run_heads_fast(x, x), next_memory
+
 
 class CNN_QRNNActor(CNNActor):
     def __init__(self, *args, qrnn_hidden_size=512, qrnn_layers=2, qrnn_norm=None, **kwargs):
@@ -55,13 +70,18 @@ class CNN_QRNNActor(CNNActor):
         self._init_heads(self.hidden_code_size)
         self.reset_weights()
 
+    @property
+    def trunk(self):
+        # `CNNActor.forward_trunk_features` needs deleted `linear`
+        return None
+
     def forward(self, input, memory, done_flags):
         seq_len, batch_len = input.shape[:2]
         input = input.contiguous().view(seq_len * batch_len, *input.shape[2:])
 
         input = image_to_float(input)
         x = self._extract_features(input)
-        x = x.view(seq_len, batch_len, -1)
+        x = x.reshape(seq_len, batch_len, -1)
         x, next_memory = self.qrnn(x, memory, done_flags)
 
         head = self._run_heads(x)
@@ -71,3 +91,22 @@ class CNN_QRNNActor(CNNActor):
             self.logger.add_histogram('conv linear', x, self._step)
 
         return head, next_memory
+
+    def step(self, input, memory, done_flags):
+        """
+        Single timestep inference. Gives same results as `forward` with sequence of length one.
+        Args:
+            input: (actors, *obs_shape)
+            memory: (layers, actors, hidden_size) or None
+            done_flags: (actors)
+
+        Returns: Head outputs without sequence dim and next memory (layers, actors, hidden_size)
+        """
+        x = image_to_float(input)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        for layer in self.convs:
+            x = layer(x)
+        x = x.reshape(x.size(0), -1)
+        x, next_memory = self.qrnn.step(x, memory, done_flags)
+        return self._run_heads_fast(x, x), next_memory
@@ -1,4 +1,5 @@
 import torch
+import torch.nn as nn
 import torch.nn.functional as F
 import torch.nn.init as init
 from torch.nn.utils import weight_norm
@@ -64,3 +65,44 @@ def normalized_columns_initializer_(weights, norm=1.0):
 
 def image_to_float(x):
     return x if x.dtype.is_floating_point else x.float().div_(255)
+
+
+def fold_batch_norm(model: nn.Module) -> nn.Module:
+    """
+    Fold eval mode `nn.BatchNorm1d` / `nn.BatchNorm2d` into preceding `nn.Linear` / `nn.Conv2d` in place.
+    Handles norms which directly follow transformation in `nn.Sequential` and modules with
+        `linear` and `norm` attributes, like `QRNNLayer`. Folded norms in `nn.Sequential` are replaced by
+        `nn.Identity`, so layer indexes are kept. Other norm types depend on input and are left as is.
+    Args:
+        model: Model in eval mode
+    Returns: `model`
+    """
+    for module in list(model.modules()):
+        if isinstance(module, nn.Sequential):
+            for i in range(1, len(module)):
+                if _fold_batch_norm_pair(module[i - 1], module[i]):
+                    module[i] = nn.Identity()
+        elif _fold_batch_norm_pair(getattr(module, 'linear', None), getattr(module, 'norm', None)):
+            module.norm = None
+    return model
+
+
+def _fold_batch_norm_pair(transf, norm):
+    """Returns: True if `norm` was folded into `transf`"""
+    if not isinstance(transf, (nn.Linear, nn.Conv2d)) or not isinstance(norm, (nn.BatchNorm1d, nn.BatchNorm2d)) or \
+            norm.training or not norm.track_running_stats:
+        return False
+    with torch.no_grad():
+        scale = (norm.running_var + norm.eps).rsqrt()
+        bias = -norm.running_mean * scale
+        if norm.affine:
+            scale *= norm.weight
+            bias = bias * norm.weight + norm.bias
+        if transf.bias is not None:
+            bias += transf.bias * scale
+        transf.weight.mul_(scale.view(-1, *[1] * (transf.weight.dim() - 1)))
+        if transf.bias is None:
+            transf.bias = nn.Parameter(bias)
+        else:
+            transf.bias.copy_(bias)
+    return True
@@ -1,3 +1,4 @@
+import copy
 import math
 import pprint
 from collections import namedtuple
@@ -8,6 +9,7 @@ import gym.spaces
 import numpy as np
 import torch
 import torch.autograd
+import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 from ..common.opt_clip import opt_clip
@@ -16,16 +18,18 @@ from torchvision.utils import make_grid
 
 from ..common.barron_loss import barron_loss, barron_loss_derivative
 from ..common.gae import calc_advantages, calc_returns
-from ..common.probability_distributions import DiagGaussianPd
+from ..common.probability_distributions import DiagGaussianPd, NoiseBuffer
 from ..common.rl_base import RLBase
 from ..models import FCActor
-from ..models.heads import PolicyHead, StateValueHead
+from ..models.heads import ActorCriticHead
+from ..models.utils import fold_batch_norm
 
 
 # Used to store env step data for training
-Sample = namedtuple('Sample', 'states, rewards, dones, probs, values, actions')
+Sample = namedtuple('Sample', 'states, rewards, dones, probs, values, actions, logps')
 # Preprocessed steps for use in in PPO training loop. Produced from multiple `Sample`.
-TrainingData = namedtuple('TrainingData', 'states, probs_old, values_old, actions, advantages, returns, dones, rewards')
+TrainingData = namedtuple('TrainingData', 'states, probs_old, values_old, actions, advantages, returns, dones, rewards, '
+                                           'logp_old')
 
 
 class PPO(RLBase):
@@ -61,6 +65,9 @@ class PPO(RLBase):
                  model_save_interval=None,
                  model_init_path=None,
                  save_intermediate_models=False,
+                 quantized_eval=False,
+                 fold_eval_norm=False,
+                 frozen_trunk=False,
                  **kwargs):
         """
         Single threaded implementation of Proximal Policy Optimization Algorithms
@@ -129,8 +136,18 @@ class PPO(RLBase):
             model_init_path (str): Path to model file to init from.
             save_intermediate_models (bool): If True, model saved at each `model_save_interval` frame
                 is saved alongside new model. Otherwise it is overwritten by new model.
+            quantized_eval (bool): Collect steps using dynamically quantized int8 copy of model.
+                Copy is updated after each training iteration. Requires `cuda_eval` == False.
+            fold_eval_norm (bool): Collect steps using eval mode copy of model with BatchNorm layers folded into
+                preceding linear / conv layers. Copy is updated after each training iteration.
+                Could be combined with `quantized_eval`.
+            frozen_trunk (bool): Don't train `model.trunk`, for example pretrained CNN loaded from `model_init_path`.
+                Trunk features are computed once per training iteration and reused in all `ppo_iters` epochs.
             num_actors (int): Number of parallel environments
             log_time_interval (float): Tensorboard logging interval in seconds
+            phase_timing (bool): Log time of training loop phases and frames / updates per second
+            memory_tracking (bool): Log peak memory of training loop phases and sizes of rollout buffers
+            memory_budget (int): RSS limit in bytes, warning is issued when it is about to be exceeded
         """
         super().__init__(observation_space, action_space, **kwargs)
         self._init_args = locals()
@@ -160,7 +177,11 @@ class PPO(RLBase):
         self.hidden_code_type = hidden_code_type
         self.barron_alpha_c = barron_alpha_c
         self.advantage_scaled_clip = advantage_scaled_clip
+        self.quantized_eval = quantized_eval
+        self.fold_eval_norm = fold_eval_norm
+        self.frozen_trunk = frozen_trunk
 
+        assert not quantized_eval or not cuda_eval, 'quantized model is supported only on CPU'
         assert len(set(self.constraint) - {'clip', 'kl', 'opt'}) == 0
         assert not image_observation or \
                isinstance(observation_space, gym.spaces.Box) and len(observation_space.shape) == 3
@@ -170,16 +191,25 @@ class PPO(RLBase):
         self.model = model_factory(observation_space, action_space, self.head_factory, hidden_code_type=hidden_code_type)
         if model_init_path is not None:
             self.model.load_state_dict(torch.load(model_init_path))
-        self.optimizer = optimizer_factory(self.model.parameters())
+        if frozen_trunk:
+            assert self.model.trunk is not None, 'model has no trunk to freeze'
+            self.model.trunk.requires_grad_(False)
+        self.optimizer = optimizer_factory([p for p in self.model.parameters() if p.requires_grad])
         self.lr_scheduler = lr_scheduler_factory(self.optimizer) if lr_scheduler_factory is not None else None
         self.clip_decay = clip_decay_factory() if clip_decay_factory is not None else None
         self.entropy_decay = entropy_decay_factory() if entropy_decay_factory is not None else None
         self.last_model_save_frame = 0
         self.grad_norms = dict()
+        self._eval_model = None
+        self._action_noise = NoiseBuffer()
+        # views of (horizon + 1, actors, actions + probs + value) host buffer for outputs of each rollout step
+        self._step_outputs = None
+        if quantized_eval or fold_eval_norm:
+            self._update_eval_model()
         # self.value_norm_mean_std = (0, 1)
 
     def head_factory(self, hidden_size, pd):
-        return dict(probs=PolicyHead(hidden_size, pd), state_value=StateValueHead(hidden_size))
+        return dict(actor_critic=ActorCriticHead(hidden_size, pd))
 
     @property
     def learning_rate(self):
@@ -189,12 +219,33 @@ class PPO(RLBase):
     def clip_mult(self):
         return self.clip_decay.value if self.clip_decay is not None else 1
 
+    @property
+    def eval_model(self):
+        """Model used to collect steps"""
+        return self._eval_model if self._eval_model is not None else self.model
+
+    def _update_eval_model(self):
+        """Create `eval_model` from current model"""
+        # logger is shared, not copied
+        model = copy.deepcopy(self.model, {id(self.model.logger): self.model.logger}).eval()
+        if self.fold_eval_norm:
+            fold_batch_norm(model)
+        if self.quantized_eval:
+            model = torch.quantization.quantize_dynamic(model.cpu(), {nn.Linear}, dtype=torch.qint8, inplace=True)
+        else:
+            model = model.to(self.device_eval)
+        model.refresh_fast_path()
+        self._eval_model = model
+
     def _step(self, prev_states, rewards, dones, cur_states) -> np.ndarray:
         # move network to cuda or cpu
         orig_grad_enabled = torch.is_grad_enabled()
         torch.set_grad_enabled(False)
 
-        self.model = self.model.to(self.device_eval)
+        # separate `eval_model` is already on its device, so learner weights stay on train device
+        if self._eval_model is None:
+            self.model = self.model.to(self.device_eval)
+        pd = self.eval_model.pd
 
         # convert observations to tensors
         if self.image_observation:
@@ -203,11 +254,15 @@ class PPO(RLBase):
             states = torch.tensor(cur_states, dtype=torch.float)
 
         # run network
-        ac_out = self._take_step(states.to(self.device_eval), dones)
-        actions = self.model.pd.sample(ac_out.probs).cpu().numpy()
+        with self.timer.span('take step'):
+            ac_out = self._take_step(states.to(self.device_eval), dones)
+            # log probabilities are kept for PPO loss, so they aren't recomputed for each minibatch
+            actions, logp = pd.sample_with_logp(ac_out.probs, self._action_noise)
 
-        probs, values = ac_out.probs.cpu().numpy(), ac_out.state_value.cpu().numpy()
-        self.append_to_sample(self.sample, states, rewards, dones, actions, probs, values)
+        actions, probs, values, logp = self._pack_step_output(actions, ac_out.probs, ac_out.state_value, logp)
+        self.append_to_sample(self.sample, states, rewards, dones, actions, probs, values, logp)
+        # sample keeps views of `_step_outputs`, so env gets a copy
+        actions = actions.to(pd.dtype, copy=True).numpy()
 
         if len(self.sample.rewards) >= self.horizon:
             self._pre_train()
@@ -218,7 +273,27 @@ class PPO(RLBase):
         return actions
 
     def _take_step(self, states, dones):
-        return self.model(states)
+        return self.eval_model(states)
+
+    def _pack_step_output(self, actions, probs, values, logp):
+        """
+        Copy outputs of current step to its row of `_step_outputs` with single device to host transfer.
+        Returns: (actions, probs, values, logp) views of that row. Actions are stored as float.
+        """
+        step = len(self.sample.states)
+        parts = [actions.reshape(probs.shape[0], -1).float(), probs, values.reshape(-1, 1), logp.reshape(-1, 1)]
+        if self._step_outputs is None:
+            sizes = [x.shape[-1] for x in parts]
+            buffer = torch.empty((self.horizon + 1, probs.shape[0], sum(sizes)),
+                                 pin_memory=self.device_eval.type == 'cuda')
+            # (row, actions, probs, values, logp) views for each step
+            self._step_outputs = [(row, *row.split(sizes, -1)) for row in buffer]
+        row, *outputs = self._step_outputs[step]
+        if probs.device.type == 'cpu':
+            torch.cat(parts, -1, out=row)
+        else:
+            row.copy_(torch.cat(parts, -1))
+        return outputs
 
     def _pre_train(self):
         self._check_log()
@@ -232,11 +307,46 @@ class PPO(RLBase):
             self.entropy_decay.step(self.frame)
 
     def _train(self):
-        data = self._process_sample(self.sample)
-        self._log_training_data(data)
-        self._ppo_update(data)
-        self.check_save_model()
-        self.sample = self.create_new_sample()
+        memory = self.memory_tracker
+        with self.timer.span('train'):
+            memory.mark('collect', live_tensors=self._do_log)
+            log_time = getattr(self.logger, 'blocking_time', None)
+            with self.timer.span('process sample'):
+                data = self._process_sample(self.sample)
+            memory.mark('process sample', live_tensors=self._do_log)
+            with self.timer.span('logging'):
+                self._log_training_data(data)
+            memory.mark('logging', live_tensors=self._do_log)
+            with self.timer.span('update'):
+                self._ppo_update(data)
+            memory.mark('update', live_tensors=self._do_log)
+            if self._do_log and memory.enabled:
+                self._track_buffer_sizes(data)
+            if self._eval_model is not None:
+                self._update_eval_model()
+            self.check_save_model()
+            self.sample = self.create_new_sample()
+            if self._do_log and log_time is not None:
+                log_time = self.logger.blocking_time - log_time
+                self.logger.add_scalar('logging time per update ms', log_time * 1000, self.frame)
+        self.timer.add_count('updates')
+        if self.profile_trigger is not None:
+            self.profile_trigger.update()
+        if self._do_log:
+            self._log_phase_times()
+            self._log_memory_usage()
+
+    def _track_buffer_sizes(self, data: TrainingData):
+        """Record byte sizes of training data fields and buffers kept between updates"""
+        for name, value in data._asdict().items():
+            self.memory_tracker.add_size(f'data {name}', value)
+        self.memory_tracker.add_size('sample', self.sample)
+        self.memory_tracker.add_size('step outputs', self._step_outputs)
+        self.memory_tracker.add_size('model', list(self.model.state_dict().values()))
+        self.memory_tracker.add_size('optimizer state', self.optimizer.state)
+        logger_bytes = getattr(self.logger, 'queued_bytes', None)
+        if logger_bytes is not None:
+            self.memory_tracker.add_bytes('logger queue', logger_bytes)
 
     def _log_training_data(self, data):
         if self._do_log:
@@ -266,7 +376,7 @@ class PPO(RLBase):
                 self.logger.add_histogram(name, param, self.frame)
 
     @staticmethod
-    def append_to_sample(sample, states, rewards, dones, actions, probs, values):
+    def append_to_sample(sample, states, rewards, dones, actions, probs, values, logps):
         # add step to history
         if len(sample.states) != 0:
             sample.rewards.append(rewards)
@@ -275,10 +385,11 @@ class PPO(RLBase):
         sample.probs.append(probs)
         sample.values.append(values)
         sample.actions.append(actions)
+        sample.logps.append(logps)
 
     @staticmethod
     def create_new_sample():
-        return Sample([], [], [], [], [], [])
+        return Sample([], [], [], [], [], [], [])
 
     def _process_sample(self, sample, pd=None, reward_discount=None, advantage_discount=None,
                         reward_scale=None, mean_norm=True):
@@ -294,9 +405,9 @@ class PPO(RLBase):
         # convert list to numpy array
         # (seq, num_actors, ...)
         rewards = torch.tensor(sample.rewards, dtype=torch.float)
-        values_old = torch.tensor(sample.values, dtype=torch.float) #* value_norm_std + value_norm_mean
+        values_old = torch.stack(sample.values).squeeze(-1) #* value_norm_std + value_norm_mean
         dones = torch.tensor(sample.dones, dtype=torch.float)
-        probs_old = torch.tensor(sample.probs[:-1], dtype=torch.float)
+        probs_old = torch.stack(sample.probs[:-1])
 
         entropy = pd.entropy(probs_old) * rewards.pow(2).mean().sqrt()
         rewards += self.entropy_reward_scale * entropy
@@ -305,7 +416,8 @@ class PPO(RLBase):
             rewards, values_old, dones, reward_discount, advantage_discount, reward_scale, mean_norm=mean_norm)
 
         # convert data to Tensors
-        actions = torch.tensor(sample.actions[:-1], dtype=pd.dtype)
+        actions = torch.stack(sample.actions[:-1]).to(pd.dtype)
+        logp_old = torch.stack(sample.logps[:-1]).reshape(-1)
         values_old = values_old[:-1].reshape(-1)
         states = torch.cat(sample.states[:-1], dim=0) if sample.states is not None else None
         dones = dones.reshape(-1)
@@ -315,7 +427,7 @@ class PPO(RLBase):
 
         probs_old, actions = [v.reshape(-1, v.shape[-1]) for v in (probs_old, actions)]
 
-        return TrainingData(states, probs_old, values_old, actions, advantages, returns, dones, rewards)
+        return TrainingData(states, probs_old, values_old, actions, advantages, returns, dones, rewards, logp_old)
 
     def _process_rewards(self, rewards, values, dones, reward_discount, advantage_discount, reward_scale, mean_norm):
         norm_rewards = reward_scale * rewards
@@ -335,8 +447,12 @@ class PPO(RLBase):
         # move model to cuda or cpu
         self.model = self.model.to(self.device_train).train()
 
-        data = (data.states.pin_memory() if self.device_train.type == 'cuda' else data.states,
-                data.probs_old, data.values_old, data.actions, data.advantages, data.returns)
+        if self.frozen_trunk:
+            self.model.trunk.eval()
+            states = self._extract_trunk_features(data.states)
+        else:
+            states = data.states.pin_memory() if self.device_train.type == 'cuda' else data.states
+        data = (states, data.probs_old, data.values_old, data.actions, data.advantages, data.returns, data.logp_old)
         batches = max(1, self.num_actors * self.horizon // self.batch_size)
 
         for ppo_iter in range(self.ppo_iters):
@@ -344,25 +460,29 @@ class PPO(RLBase):
             for loader_iter in range(batches):
                 # prepare batch data
                 batch_idx = rand_idx[loader_iter * self.batch_size: (loader_iter + 1) * self.batch_size]
-                st, po, vo, ac, adv, ret = [x[batch_idx].to(self.device_train) for x in data]
+                st, po, vo, ac, adv, ret, lpo = [x[batch_idx].to(self.device_train) for x in data]
                 if ppo_iter == self.ppo_iters - 1 and loader_iter == 0:
                     self.model.set_log(self.logger, self._do_log, self.step)
 
-                with torch.enable_grad():
-                    actor_out = self.model(st)
+                with torch.enable_grad(), self.timer.span('forward'):
+                    actor_out = self.model.forward_trunk_features(st) if self.frozen_trunk else self.model(st)
                     probs = actor_out.probs
                     values = actor_out.state_value
                     # values, vo, ret = [(x - ret_mean) / ret_std for x in (values, vo, ret)]
                     # get loss
-                    loss, kl = self._get_ppo_loss(probs, po, values, vo, ac, adv, ret)
+                    loss, kl = self._get_ppo_loss(probs, po, values, vo, ac, adv, ret, logp_old=lpo)
                     loss = loss.mean()
+                    if ppo_iter == 0 and loader_iter == 0:
+                        self._log_behaviour_mismatch(probs, po, ac)
 
                 # optimize
-                loss.backward()
-                if self.grad_clip_norm is not None:
-                    clip_grad_norm_(self.model.parameters(), self.grad_clip_norm)
-                self.optimizer.step()
-                self.optimizer.zero_grad()
+                with self.timer.span('backward'):
+                    loss.backward()
+                    if self.grad_clip_norm is not None:
+                        clip_grad_norm_(self.model.parameters(), self.grad_clip_norm)
+                with self.timer.span('optimizer'):
+                    self.optimizer.step()
+                    self.optimizer.zero_grad()
 
                 self.model.set_log(self.logger, False, self.step)
 
@@ -372,9 +492,32 @@ class PPO(RLBase):
                 self.logger.add_scalar('total loss', loss, self.frame)
                 self.logger.add_scalar('kl', kl, self.frame)
 
-    def _get_ppo_loss(self, probs, probs_old, values, values_old, actions, advantages, returns, pd=None, tag=''):
+    def _extract_trunk_features(self, states):
+        """Run frozen `model.trunk` over all `states` in chunks of `batch_size`"""
+        with torch.no_grad():
+            return torch.cat([self.model.extract_trunk_features(x.to(self.device_train))
+                              for x in states.split(self.batch_size)], 0)
+
+    def _log_behaviour_mismatch(self, probs, probs_old, actions):
+        """
+        Log difference between policy used to collect steps and trained policy.
+        Should be called before first optimizer step.
+        """
+        if not self._do_log or self._eval_model is None:
+            return
+        with torch.no_grad():
+            stats = self.model.pd.stats(actions, probs, probs_old)
+            logp_diff = stats.logp - stats.logp_old
+            self.logger.add_scalar('eval model logp abs diff', logp_diff.abs().mean(), self.frame)
+            self.logger.add_scalar('eval model logp abs max diff', logp_diff.abs().max(), self.frame)
+            self.logger.add_scalar('eval model kl', stats.kl.mean(), self.frame)
+
+    def _get_ppo_loss(self, probs, probs_old, values, values_old, actions, advantages, returns, pd=None, tag='',
+                      logp_old=None):
         """
         Single iteration of PPO algorithm.
+        Args:
+            logp_old: Log probabilities of `actions` stored at sampling. Computed from `probs_old` if None.
         Returns: Total loss and KL divergence.
         """
 
@@ -395,11 +538,12 @@ class PPO(RLBase):
             probs = opt_clip(probs, probs_old, policy_clip)
             values = opt_clip(values, values_old, value_clip)
 
+        # log probabilities, entropy and kl computed together
+        stats = pd.stats(actions, probs, probs_old, logp_old)
+
         # action probability ratio
         # log probabilities used for better numerical stability
-        logp_old = pd.logp(actions, probs_old)
-        logp = pd.logp(actions, probs)
-        ratio = logp - logp_old.detach()
+        ratio = stats.logp - stats.logp_old.detach()
 
         unclipped_policy_loss = ratio * advantages
         if 'clip' in self.constraint:
@@ -425,13 +569,13 @@ class PPO(RLBase):
         loss_value = self.value_loss_scale * torch.max(vf_nonclip_loss, vf_clip_loss)
 
         # entropy bonus for better exploration
-        entropy = pd.entropy(probs)
+        entropy = stats.entropy
         # entropy_old = pd.entropy(probs_old)
 
         loss_ent = -self.entropy_loss_scale * entropy
         # loss_ent[(entropy > entropy_old + self.entropy_bonus).detach()] = 0
 
-        kl = pd.kl(probs_old, probs)
+        kl = stats.kl
         if 'kl' in self.constraint:
             kl_targets = self.kl_target * advantages.abs()
             loss_kl = (kl - kl_targets).div(self.kl_target).pow(2).mul(self.kl_scale * self.kl_target)
@@ -473,7 +617,7 @@ class PPO(RLBase):
         self.logger.add_text('Model', str(self.model))
 
     def drop_collected_steps(self):
-        self.sample = Sample(states=[], probs=[], values=[], actions=[], rewards=[], dones=[])
+        self.sample = self.create_new_sample()
 
     def check_save_model(self):
         if self.model_save_interval is None or \
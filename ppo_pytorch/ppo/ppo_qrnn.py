@@ -6,19 +6,39 @@ from torch.nn.utils import clip_grad_norm_
 
 from .ppo import PPO, TrainingData
 from ..models import QRNNActor
-from ..models.heads import HeadOutput
 from ..models.utils import image_to_float
 
+# Recurrent state at start of each training sequence (chunks, layers, actors, hidden_size)
+# and episode reset flags of each step (steps, actors)
 RNNData = namedtuple('RNNData', 'memory, dones')
 
 
 class PPO_QRNN(PPO):
     def __init__(self, observation_space, action_space,
                  model_factory=QRNNActor,
-                 *args, **kwargs):
+                 *args, seq_len=None, burn_in=0, **kwargs):
+        """
+        PPO with recurrent model trained using truncated backpropagation through time.
+        Rollout of each actor is split into sequences of `seq_len` steps, `batch_size` is measured in steps,
+            so each minibatch contains about `batch_size / seq_len` sequences.
+        Args:
+            seq_len (int): Training sequence length. `horizon` must be divisible by it.
+                None to use min(`horizon`, `batch_size`).
+            burn_in (int): Number of steps preceding each sequence, which are used only to refresh
+                stored recurrent state with current model. Must be <= `seq_len`. First sequence of rollout
+                has no preceding steps and uses stored state as is.
+        """
         super().__init__(observation_space, action_space, model_factory=model_factory, *args, **kwargs)
-        self._rnn_data = RNNData([], [])
-        assert (self.horizon * self.num_actors) % self.batch_size == 0
+        assert not self.frozen_trunk, 'frozen trunk is not supported by PPO_QRNN'
+        self.seq_len = min(self.horizon, self.batch_size) if seq_len is None else seq_len
+        self.burn_in = burn_in
+        assert self.horizon % self.seq_len == 0
+        assert 0 <= burn_in <= self.seq_len
+        self._rnn_data = None
+        self._rnn_step = 0
+        self._memory = None
+        # (actors, horizon, ...)
+        self._rollout_states = None
 
     def _reorder_data(self, data) -> TrainingData:
         def reorder(input):
@@ -34,72 +54,135 @@ class PPO_QRNN(PPO):
         data = [reorder(v) for v in data.values()]
         return TrainingData._make(data)
 
+    def append_to_sample(self, sample, states, rewards, dones, actions, probs, values, logps):
+        # states are written directly to actor-major `_rollout_states`, `sample.states` keeps only step indices
+        step = len(sample.states)
+        if step < self.horizon:
+            if self._rollout_states is None:
+                self._rollout_states = torch.empty((self.num_actors, self.horizon, *states.shape[1:]),
+                                                   dtype=states.dtype, pin_memory=self.device_train.type == 'cuda')
+            self._rollout_states[:, step] = states
+        if step != 0:
+            sample.rewards.append(rewards)
+            sample.dones.append(dones)
+        sample.states.append(step)
+        sample.probs.append(probs)
+        sample.values.append(values)
+        sample.actions.append(actions)
+        sample.logps.append(logps)
+
+    def _process_sample(self, sample, *args, **kwargs):
+        data = super()._process_sample(sample._replace(states=None), *args, **kwargs)
+        # (actors * seq, ...)
+        data = self._reorder_data(data)
+        return data._replace(states=self._rollout_states.view(-1, *self._rollout_states.shape[2:]))
+
+    def _track_buffer_sizes(self, data):
+        super()._track_buffer_sizes(data)
+        self.memory_tracker.add_size('rollout states', self._rollout_states)
+        if self._rnn_data is not None:
+            self.memory_tracker.add_size('rnn memory', self._rnn_data.memory)
+            self.memory_tracker.add_size('rnn dones', self._rnn_data.dones)
+
     def _take_step(self, states, dones):
-        self.model.eval()
+        model = self.eval_model.eval()
 
-        mem = self._rnn_data.memory[-1] if len(self._rnn_data.memory) != 0 else None
+        mem = self._memory
         dones = torch.zeros(self.num_actors) if dones is None else torch.from_numpy(np.asarray(dones, np.float32))
-        dones = dones.unsqueeze(0)
         dones = dones.to(self.device_eval)
-        states = states.unsqueeze(0)
-        ac_out, next_mem = self.model(states, mem, dones)
-
-        if len(self._rnn_data.memory) == 0:
-            self._rnn_data.memory.append(next_mem.clone().fill_(0))
-        self._rnn_data.memory.append(next_mem)
-        self._rnn_data.dones.append(dones[0])
-
-        return HeadOutput(probs=ac_out.probs.squeeze(0), state_value=ac_out.state_value.squeeze(0))
+        ac_out, self._memory = model.step(states, mem, dones)
+
+        if self._rnn_data is None:
+            self._rnn_data = RNNData(self._memory.new_zeros(self.horizon // self.seq_len, *self._memory.shape),
+                                     dones.new_zeros(self.horizon, self.num_actors))
+        # last step of rollout is used only for value bootstrap
+        if self._rnn_step < self.horizon:
+            for chunk in self._memory_chunk_indices(self._rnn_step):
+                chunk_mem = self._rnn_data.memory[chunk]
+                if mem is None:
+                    chunk_mem.fill_(0)
+                else:
+                    chunk_mem.copy_(mem)
+            self._rnn_data.dones[self._rnn_step] = dones
+        self._rnn_step += 1
+
+        return ac_out
+
+    def _memory_chunk_indices(self, step):
+        """
+        Returns: Indices of sequences for which state before rollout `step` is stored.
+            Stored state is taken at start of sequence's burn-in. If `burn_in == seq_len`,
+            burn-in of second sequence starts at step 0 together with first sequence.
+        """
+        chunks = [0] if step == 0 else []
+        if (step + self.burn_in) % self.seq_len == 0:
+            chunk = (step + self.burn_in) // self.seq_len
+            if chunk != 0 and chunk < self.horizon // self.seq_len:
+                chunks.append(chunk)
+        return chunks
+
+    def _burn_in_memory(self, states, dones, memory, ids, chunk_ids, actor_ids):
+        """
+        Run model over `burn_in` steps preceding each sequence to refresh its initial recurrent state.
+        Args:
+            states: (actors * chunks, seq, ...)
+            dones: (chunks, seq, actors)
+            memory: (layers, ids, hidden_size) state at burn-in start
+        Returns: (layers, ids, hidden_size) state at sequence start
+        """
+        has_prev = (chunk_ids != 0).nonzero().view(-1)
+        if len(has_prev) == 0:
+            return memory
+        # (burn_in, sequences, ...)
+        st = states[ids[has_prev] - 1, -self.burn_in:].to(self.device_train).transpose(0, 1).contiguous()
+        done = dones[chunk_ids[has_prev] - 1, -self.burn_in:, actor_ids[has_prev]].t().contiguous()
+        # same deterministic model as in rollout, without updating BatchNorm statistics
+        training = self.model.training
+        self.model.eval()
+        with torch.no_grad():
+            _, burned_in = self.model(image_to_float(st), memory[:, has_prev].contiguous(), done)
+        self.model.train(training)
+        memory[:, has_prev] = burned_in
+        return memory
 
     def _ppo_update(self, data):
         self.model.train()
         # move model to cuda or cpu
         self.model = self.model.to(self.device_train)
 
-        data = self._reorder_data(data)
-
-        memory = torch.stack(self._rnn_data.memory[:-2], 0)  # (steps, layers, actors, hidden_size)
-        memory = memory.permute(2, 0, 1, 3)  # (actors, steps, layers, hidden_size)
-        memory = memory.contiguous().view(-1, *memory.shape[2:]) # (actors * steps, layers, hidden_size)
-
-        dones = self._rnn_data.dones[:-1] # (steps, actors)
-        dones = torch.stack(dones, 0).transpose(0, 1).contiguous().view(-1) # (actors * steps)
-
-        self._rnn_data = RNNData(self._rnn_data.memory[-1:], [])
-
-        # actor_switch_flags = torch.zeros(self.horizon)
-        # actor_switch_flags[-1] = 1
-        # actor_switch_flags = actor_switch_flags.repeat(self.num_actors)
+        num_chunks = self.horizon // self.seq_len
+        # (chunks, layers, actors, hidden_size)
+        memory = self._rnn_data.memory.to(self.device_train)
+        # (chunks, seq, actors)
+        dones = self._rnn_data.dones.to(self.device_train).view(num_chunks, self.seq_len, self.num_actors)
+        self._rnn_step = 0
 
         # (actors * steps, ...)
-        data = (data.states.pin_memory() if self.device_train.type == 'cuda' else data.states,
-                data.probs_old, data.values_old, data.actions, data.advantages,
-                data.returns, memory, dones)
-        # (actors, steps, ...)
-        num_actors = self.num_actors
-        if self.horizon > self.batch_size:
-            assert self.horizon % self.batch_size == 0
-            num_actors *= self.horizon // self.batch_size
-            batches = num_actors
-        else:
-            batches = max(1, num_actors * self.horizon // self.batch_size)
-
-        data = [x.contiguous().view(num_actors, -1, *x.shape[1:]) for x in data]
+        data = (data.states, data.probs_old, data.values_old, data.actions, data.advantages, data.returns,
+                data.logp_old)
+        # (actors * chunks, seq, ...)
+        num_seqs = self.num_actors * num_chunks
+        batches = max(1, round(num_seqs * self.seq_len / self.batch_size))
+
+        data = [x.contiguous().view(num_seqs, -1, *x.shape[1:]) for x in data]
 
         for ppo_iter in range(self.ppo_iters):
-            actor_index_chunks = torch.randperm(num_actors).to(self.device_train).chunk(batches)
-            for loader_iter, ids in enumerate(actor_index_chunks):
+            seq_index_chunks = torch.randperm(num_seqs).to(self.device_train).chunk(batches)
+            for loader_iter, ids in enumerate(seq_index_chunks):
                 # prepare batch data
                 # (actors * steps, ...)
-                st, po, vo, ac, adv, ret, mem, done = [
+                st, po, vo, ac, adv, ret, lpo = [
                     x[ids].to(self.device_train).view(-1, *x.shape[2:])
                     for x in data]
+                actor_ids, chunk_ids = ids // num_chunks, ids % num_chunks
                 # (steps, actors, ...)
-                st, mem, done = [x.contiguous().view(ids.shape[0], -1, *x.shape[1:]).transpose(0, 1) for x in (st, mem, done)]
+                st = st.view(ids.shape[0], -1, *st.shape[1:]).transpose(0, 1)
                 # (layers, actors, hidden_size)
-                mem = mem[0].transpose(0, 1)
+                mem = memory[chunk_ids, :, actor_ids].transpose(0, 1)
+                if self.burn_in != 0:
+                    mem = self._burn_in_memory(data[0], dones, mem, ids, chunk_ids, actor_ids)
                 # (steps, actors)
-                done = done.contiguous().view(done.shape[:2])
+                done = dones[chunk_ids, :, actor_ids].t()
 
                 st, mem, done = (x.contiguous() for x in (st, mem, done))
                 st = image_to_float(st)
@@ -107,14 +190,16 @@ class PPO_QRNN(PPO):
                 if ppo_iter == self.ppo_iters - 1 and loader_iter == 0:
                     self.model.set_log(self.logger, self._do_log, self.step)
 
-                with torch.enable_grad():
+                with torch.enable_grad(), self.timer.span('forward'):
                     actor_out, _ = self.model(st, mem, done)
                     # (actors * steps, probs)
                     probs = actor_out.probs.transpose(0, 1).contiguous().view(-1, actor_out.probs.shape[2])
                     # (actors * steps)
                     state_value = actor_out.state_value.transpose(0, 1).contiguous().view(-1)
                     # get loss
-                    loss, kl = self._get_ppo_loss(probs, po, state_value, vo, ac, adv, ret)
+                    loss, kl = self._get_ppo_loss(probs, po, state_value, vo, ac, adv, ret, logp_old=lpo)
+                    if ppo_iter == 0 and loader_iter == 0:
+                        self._log_behaviour_mismatch(probs, po, ac)
                     # loss_vat = get_vat_loss(
                     #     lambda x: self.model(x.view_as(st), mem, done)[0].probs.view_as(probs),
                     #     st.view(-1, *st.shape[2:]),
@@ -123,11 +208,13 @@ class PPO_QRNN(PPO):
                     loss = loss.mean()
 
                 # optimize
-                loss.backward()
-                if self.grad_clip_norm is not None:
-                    clip_grad_norm_(self.model.parameters(), self.grad_clip_norm)
-                self.optimizer.step()
-                self.optimizer.zero_grad()
+                with self.timer.span('backward'):
+                    loss.backward()
+                    if self.grad_clip_norm is not None:
+                        clip_grad_norm_(self.model.parameters(), self.grad_clip_norm)
+                with self.timer.span('optimizer'):
+                    self.optimizer.step()
+                    self.optimizer.zero_grad()
 
                 self.model.set_log(self.logger, False, self.step)
 
@@ -139,5 +226,6 @@ class PPO_QRNN(PPO):
 
     def drop_collected_steps(self):
         super().drop_collected_steps()
-        self._rnn_data = RNNData([], [])
+        self._rnn_step = 0
+        self._memory = None
 